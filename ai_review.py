@@ -0,0 +1,258 @@
+"""Batched, cached AI review of award line items.
+
+Line items from any number of awards are reviewed together: identical items
+are collapsed, items already decided under the current policy version are
+answered from ``llm_decision_cache``, and only the rest go to the reviewer
+backend, ``AI_REVIEW_BATCH_SIZE`` items per model call.
+
+Backends (AI_REVIEW_BACKEND):
+    stub  deterministic, no network: the compiled policy rules' verdict
+    http  an OpenAI-compatible chat completions endpoint (LLM_API_URL,
+          LLM_API_KEY, LLM_MODEL); the prompt carries only the policy
+          clauses policy_index retrieves for the batch's items
+
+The reviewer decision depends only on (normalized item, policy version,
+reviewer) -- the reviewer being the backend and, for http, the model -- so
+it is safe to cache. Each batch is committed to the cache as soon as the
+model answers, so a later failure does not lose decisions already paid
+for. Rules that look at several items at once (split purchases) are re-run
+per award by the caller and merged with ``worst``.
+"""
+import hashlib
+import json
+import os
+import urllib.request
+
+from psycopg2.extras import execute_values
+
+from db import db_connection
+from policy_index import get_index
+from policy_rules import DISALLOW, NEEDS_APPROVAL
+
+ALLOW = "Allow"
+# llm_responses.llm_decision values, mildest first
+DECISION_SEVERITY = {ALLOW: 0, NEEDS_APPROVAL: 1, DISALLOW: 2}
+
+AI_REVIEW_BACKEND = os.getenv("AI_REVIEW_BACKEND", "stub")
+AI_REVIEW_BATCH_SIZE = int(os.getenv("AI_REVIEW_BATCH_SIZE", "50"))
+
+LLM_API_URL = os.getenv("LLM_API_URL", "https://api.openai.com/v1/chat/completions")
+LLM_API_KEY = os.getenv("LLM_API_KEY")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+
+def worst(*decisions):
+    """The most severe of the given decisions (None entries ignored)."""
+    return max((d for d in decisions if d), key=DECISION_SEVERITY.get, default=ALLOW)
+
+
+def normalize_item(item):
+    """The parts of a line item the reviewer sees; ids and labels excluded."""
+    amount = item.get("amount")
+    return {
+        "category": item.get("category"),
+        "text": " ".join((item.get("text") or "").lower().split()),
+        "amount": round(float(amount), 2) if amount is not None else None,
+    }
+
+
+def item_hash(normalized, policy_version, reviewer):
+    payload = json.dumps([policy_version, reviewer, normalized], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class StubBackend:
+    """Deterministic reviewer: the worst compiled-rule finding for the item."""
+
+    name = "stub"
+    reviewer = "stub"
+
+    def review(self, batch, rules):
+        decisions = []
+        for entry in batch:
+            findings = rules.screen([dict(entry, ref=0)]).get(0, [])
+            if not findings:
+                decisions.append((ALLOW, "No policy rule matched."))
+                continue
+            decision = worst(*(f["decision"] for f in findings))
+            decisions.append((decision, "; ".join(f["reason"] for f in findings)))
+        return decisions
+
+
+class HttpBackend:
+    """Reviewer backed by an OpenAI-compatible chat completions API."""
+
+    name = "http"
+
+    def __init__(self, url=LLM_API_URL, api_key=LLM_API_KEY, model=LLM_MODEL, timeout=LLM_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.reviewer = f"http:{model}"
+
+    def _policy_context(self, rules, batch):
+        """Only the clauses the retrieval index ranks highest for these items."""
+        index = get_index(rules)
+        picked = {}
+        for entry in batch:
+            for _score, chunk in index.search(entry["text"], category=entry["category"]):
+                picked[chunk["id"]] = chunk
+        lines = []
+        heading = None
+        for _id, chunk in sorted(picked.items()):
+            if (chunk["level"], chunk["heading"]) != heading:
+                heading = (chunk["level"], chunk["heading"])
+                lines.append(f"[{chunk['level']}] {chunk['heading']}")
+            lines.append(f"  {chunk['kind']}: {chunk['clause']}")
+        return "\n".join(lines) or "(no matching policy clauses)"
+
+    def review(self, batch, rules):
+        items = [
+            {"index": i, "category": e["category"], "text": e["text"], "amount": e["amount"]}
+            for i, e in enumerate(batch)
+        ]
+        prompt = (
+            "You review research grant budget line items against these policies:\n\n"
+            f"{self._policy_context(rules, batch)}\n\n"
+            "For every item return a decision of exactly \"Allow\", "
+            "\"Allow with Prior Approval\" or \"Disallow\" and a one-sentence reason. "
+            'Answer with JSON only: {"decisions": [{"index": 0, "decision": "...", '
+            '"reason": "..."}]}\n\n'
+            f"Items:\n{json.dumps(items)}"
+        )
+        body = json.dumps({
+            "model": self.model,
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+            "messages": [{"role": "user", "content": prompt}],
+        }).encode()
+        req = urllib.request.Request(self.url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        })
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            reply = json.loads(resp.read())
+        content = json.loads(reply["choices"][0]["message"]["content"])
+
+        by_index = {d.get("index"): d for d in content.get("decisions", [])}
+        decisions = []
+        for i in range(len(batch)):
+            d = by_index.get(i)
+            if d is None or d.get("decision") not in DECISION_SEVERITY:
+                # Fail the whole batch; the job is retried with backoff
+                raise ValueError(f"reviewer returned no valid decision for item {i}")
+            decisions.append((d["decision"], (d.get("reason") or "").strip()))
+        return decisions
+
+
+BACKENDS = {
+    "stub": StubBackend,
+    "http": HttpBackend,
+}
+
+
+def get_backend(name=None):
+    name = name or AI_REVIEW_BACKEND
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown AI review backend {name!r}") from None
+
+
+def review_items(items, rules, backend=None, batch_size=AI_REVIEW_BATCH_SIZE, progress=None):
+    """
+    Reviewer decision for every item (policy_rules line-item dicts, "ref"
+    unique across the call). Cache misses are sent to ``backend`` in batches;
+    llm_decision_cache is read and written on short transactions of its own,
+    one per batch, so none stays open across model calls.
+
+    Returns ({ref: {"decision", "reason", "item_hash"}}, stats).
+    """
+    backend = backend or get_backend()
+    version = rules.digest
+
+    ref_hash = {}
+    unique = {}    # item_hash -> normalized item
+    for item in items:
+        normalized = normalize_item(item)
+        h = item_hash(normalized, version, backend.reviewer)
+        ref_hash[item["ref"]] = h
+        unique.setdefault(h, normalized)
+
+    decided = {}
+    if unique:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT item_hash, llm_decision, reason FROM llm_decision_cache "
+                "WHERE item_hash = ANY(%s)",
+                (list(unique),),
+            )
+            for h, decision, reason in cur.fetchall():
+                decided[h] = (decision, reason)
+            conn.rollback()
+            cur.close()
+    cached = len(decided)
+
+    missing = [h for h in unique if h not in decided]
+    calls = 0
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        results = backend.review([unique[h] for h in chunk], rules)
+        calls += 1
+        rows = []
+        for h, (decision, reason) in zip(chunk, results):
+            decided[h] = (decision, reason)
+            rows.append((h, version, decision, reason, backend.name))
+        with db_connection() as conn:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                """
+                INSERT INTO llm_decision_cache
+                    (item_hash, policy_version, llm_decision, reason, backend)
+                VALUES %s
+                ON CONFLICT (item_hash) DO NOTHING
+                """,
+                rows,
+            )
+            conn.commit()
+            cur.close()
+        if progress:
+            progress(start + len(chunk), len(missing))
+
+    out = {
+        ref: {"decision": decided[h][0], "reason": decided[h][1], "item_hash": h}
+        for ref, h in ref_hash.items()
+    }
+    stats = {
+        "items": len(items),
+        "unique": len(unique),
+        "cached": cached,
+        "reviewed": len(missing),
+        "model_calls": calls,
+    }
+    return out, stats
+
+
+def write_responses(cur, award_id, rows):
+    """
+    Replace an award's line-item rows in llm_responses.
+    rows: [(line_item_ref, item_hash, decision, reason)]
+    """
+    cur.execute(
+        "DELETE FROM llm_responses WHERE award_id = %s AND transaction_id IS NULL",
+        (award_id,),
+    )
+    if rows:
+        execute_values(
+            cur,
+            """
+            INSERT INTO llm_responses
+                (award_id, line_item_ref, item_hash, llm_decision, reason)
+            VALUES %s
+            """,
+            [(award_id, *row) for row in rows],
+        )
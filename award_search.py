@@ -0,0 +1,117 @@
+"""Ranked full-text search over awards, with facet counts.
+
+Awards carry a generated, GIN-indexed ``search_vector`` built from the
+title, keywords, PI email, abstract and collaborators (see
+migrations/0012_award_search.sql). ``search_awards`` answers a request in
+one statement: the matches are collected once, and both the requested
+page and the per-facet counts are read from them. Pages are ordered by
+rank and walked with a (rank, award_id) keyset cursor.
+"""
+import base64
+
+SEARCH_CONFIG = "english"
+# Columns counted per value for the whole match set
+SEARCH_FACETS = ("status", "sponsor_type", "college", "department")
+# Values listed per facet (most frequent first)
+FACET_LIMIT = 20
+
+
+def encode_cursor(hit):
+    """Opaque keyset cursor for the last hit of a page: '<rank>|<award_id>'."""
+    raw = f"{hit['rank']!r}|{hit['award_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (rank, award_id) or None if the token is missing/garbled."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        rank, award_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return float(rank), int(award_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def search_awards(cur, text, filters=None, cursor_token=None, limit=50,
+                  base_where=(), base_params=()):
+    """
+    Search awards for ``text`` (web-search syntax: words, "phrases", -not,
+    or) narrowed by ``filters`` ({column: exact value}) and ``base_where``.
+
+    Returns {"total", "results", "facets", "next_cursor"}; results are
+    dicts ranked best first, facets maps each of SEARCH_FACETS to
+    [{"value", "count"}]. A blank ``text`` lists every award (unranked,
+    newest id first) so the facets still work as a browser.
+    """
+    where = list(base_where)
+    params = list(base_params)
+    for column, value in (filters or {}).items():
+        if value:
+            where.append(f"a.{column} = %s")
+            params.append(value)
+
+    text = (text or "").strip()
+    if text:
+        rank = "ts_rank(a.search_vector, q.query)"
+        where.append("a.search_vector @@ q.query")
+    else:
+        rank = "0::real"
+
+    page_where = "TRUE"
+    after = decode_cursor(cursor_token)
+    if after:
+        page_where = "(rank, award_id) < (%s::real, %s)"
+
+    # Plain tuples whatever cursor factory the caller uses
+    cur = cur.connection.cursor()
+    cur.execute(
+        f"""
+        WITH q AS (
+            SELECT websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS query
+        ),
+        matched AS (
+            SELECT a.award_id, a.title, a.created_by_email, a.sponsor_type,
+                   a.college, a.department, a.amount, a.start_date, a.end_date,
+                   a.status, {rank} AS rank
+            FROM awards a, q
+            WHERE {" AND ".join(where) or "TRUE"}
+        ),
+        page AS (
+            SELECT * FROM matched
+            WHERE {page_where}
+            ORDER BY rank DESC, award_id DESC
+            LIMIT %s
+        ),
+        facets AS (
+            SELECT f.facet, f.value, COUNT(*) AS count
+            FROM matched m
+            CROSS JOIN LATERAL (VALUES
+                {", ".join(f"('{c}', m.{c})" for c in SEARCH_FACETS)}
+            ) AS f(facet, value)
+            WHERE f.value IS NOT NULL
+            GROUP BY f.facet, f.value
+        )
+        SELECT (SELECT COUNT(*) FROM matched) AS total,
+               (SELECT COALESCE(json_agg(p ORDER BY p.rank DESC, p.award_id DESC), '[]')
+                FROM page p) AS results,
+               (SELECT COALESCE(json_agg(f ORDER BY f.facet, f.count DESC, f.value), '[]')
+                FROM facets f) AS facets
+        """,
+        (text, *params, *(after or ()), limit + 1),
+    )
+    total, results, facet_rows = cur.fetchone()
+    cur.close()
+
+    facets = {column: [] for column in SEARCH_FACETS}
+    for row in facet_rows:
+        values = facets[row["facet"]]
+        if len(values) < FACET_LIMIT:
+            values.append({"value": row["value"], "count": row["count"]})
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_cursor(results[-1])
+    return {"total": total, "results": results, "facets": facets, "next_cursor": next_cursor}
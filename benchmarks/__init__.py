@@ -0,0 +1 @@
+"""Performance benchmarks for GrantGuard (run with python -m benchmarks.<name>)."""
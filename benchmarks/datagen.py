@@ -0,0 +1,267 @@
+"""Synthetic GrantGuard data for benchmarks.
+
+Run from the repo root against an empty (migrated) database:
+
+    python -m benchmarks.datagen [--pis 50] [--awards 2000] [--transactions 20000] [--seed 1]
+
+Generates PI users (password BENCH_PASSWORD), awards with realistic
+personnel / travel / materials line items (detail rows, per-year hours and
+budget summary columns written the same way the app writes them), and
+transactions whose budget_lines rollups and portfolio summaries are
+rebuilt with budget_lines.reconcile. Output is a pure function of the seed,
+so two runs on the same commit see the same data.
+"""
+import argparse
+import json
+import random
+import uuid
+from datetime import date, datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+BENCH_PASSWORD = "bench"
+BENCH_EMAIL_DOMAIN = "bench.example.edu"
+# Relative share of generated awards per status
+STATUS_WEIGHTS = {"Draft": 30, "Pending": 15, "AI passed": 20, "Approved": 25, "Declined": 10}
+
+SPONSOR_TYPES = ("NSF", "NIH", "DOE", "DOD", "NASA", "USDA", "Foundation", "Industry")
+COLLEGES = {
+    "Engineering": ("Computer Science", "Electrical Engineering", "Mechanical Engineering"),
+    "Science": ("Biology", "Chemistry", "Physics"),
+    "Health": ("Nursing", "Public Health"),
+    "Arts & Letters": ("History", "Psychology"),
+}
+POSITIONS = ("PI", "Co-PI", "Postdoc", "Graduate Assistant", "Undergraduate Assistant", "Technician")
+MATERIAL_TYPES = ("Lab consumables", "Software licenses", "Computing supplies",
+                  "Equipment - Microscope", "Equipment - Workstation", "Field supplies")
+CITIES = ("Boston", "Denver", "Chicago", "Seattle", "Atlanta", "Austin")
+INTL_CITIES = ("Berlin", "Tokyo", "Nairobi", "Lima", "Sydney")
+TRANSACTION_CATEGORIES = ("Personnel", "Travel", "Materials and Supplies", "Equipment",
+                          "Computer Services", "Other Direct Costs")
+
+
+def _item_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def award_lists(rng, start_year, end_year):
+    """(personnel, domestic_travel, international_travel, materials) in the form's JSON shape."""
+    years = list(range(start_year, end_year + 1))
+    personnel = []
+    for i in range(rng.randint(1, 6)):
+        same = rng.random() < 0.5
+        base = rng.choice((80, 120, 250, 500, 1000))
+        personnel.append({
+            "id": _item_id(rng),
+            "name": f"Person {rng.randint(1, 9999)}",
+            "position": POSITIONS[min(i, len(POSITIONS) - 1)] if i < 2 else rng.choice(POSITIONS[2:]),
+            "same_each_year": same,
+            "hours": [{"year": y, "hours": base if same else rng.choice((40, 80, 160, 320, 640))}
+                      for y in years],
+        })
+
+    def trip(cities, international):
+        year = rng.choice(years)
+        depart = date(year, rng.randint(1, 12), rng.randint(1, 25))
+        days = rng.randint(2, 9 if international else 5)
+        return {
+            "id": _item_id(rng),
+            "name": f"{rng.choice(('Conference', 'Workshop', 'Field work', 'Site visit'))} "
+                    f"{rng.choice(cities)}",
+            "description": rng.choice(("Present results", "Collaborator meeting", "Data collection")),
+            "year": str(year),
+            "depart": depart.isoformat(),
+            "arrive": (depart + timedelta(days=days)).isoformat(),
+            "flight": rng.choice((250, 400, 650)) * (3 if international else 1),
+            "taxi_per_day": rng.choice((20, 30, 45)),
+            "food_per_day": rng.choice((90, 120, 160, 220)),
+            "days": days,
+        }
+
+    domestic = [trip(CITIES, False) for _ in range(rng.randint(0, 4))]
+    international = [trip(INTL_CITIES, True) for _ in range(rng.randint(0, 2))]
+    materials = [
+        {
+            "id": _item_id(rng),
+            "category": rng.choice(MATERIAL_TYPES),
+            "cost": round(rng.uniform(100, 15000), 2),
+            "description": rng.choice(("Reagents", "Licenses", "Sensors", "Cloud credits", "Microscope")),
+            "year": str(rng.choice(years)),
+        }
+        for _ in range(rng.randint(1, 8))
+    ]
+    return personnel, domestic, international, materials
+
+
+def award_form(rng, email, title=None):
+    """Form fields for POST /awards (and /awards/<id>/edit) with a consistent amount."""
+    from budget_calc import compute_budget
+
+    start_year = rng.randint(2023, 2027)
+    start = date(start_year, rng.choice((1, 7, 9)), 1)
+    end = date(start_year + rng.randint(0, 3), 12, 31)
+    lists = award_lists(rng, start.year, end.year)
+    total = compute_budget(*lists, start_date=start, end_date=end).total
+    college = rng.choice(sorted(COLLEGES))
+    return {
+        "title": title or f"{rng.choice(('Adaptive', 'Scalable', 'Robust', 'Integrated'))} "
+                          f"{rng.choice(('sensing', 'learning', 'materials', 'genomics', 'policy'))} "
+                          f"study {rng.randint(1, 99999)}",
+        "sponsor_type": rng.choice(SPONSOR_TYPES),
+        "department": rng.choice(COLLEGES[college]),
+        "college": college,
+        "contact_email": email,
+        "amount": f"{total:.2f}",
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "abstract": "Synthetic award for benchmarking. " * rng.randint(2, 20),
+        "keywords": ", ".join(rng.sample(("ai", "climate", "health", "energy", "water", "data"), 3)),
+        "collaborators": rng.choice(("None", "State University", "National Lab")),
+        "personnel_json": json.dumps(lists[0]),
+        "domestic_travel_json": json.dumps(lists[1]),
+        "international_travel_json": json.dumps(lists[2]),
+        "materials_json": json.dumps(lists[3]),
+    }
+
+
+def pi_email(n):
+    return f"pi{n}@{BENCH_EMAIL_DOMAIN}"
+
+
+def generate(conn, pis=50, awards=2000, transactions=20000, seed=1, batch_size=500):
+    """Insert the synthetic data set and commit; returns row counts."""
+    from app import (BUDGET_JSON_COLUMNS, DETAIL_TABLES, _budget_detail_rows,
+                     _budget_json_hashes, _form_budget_columns, _insert_detail_rows,
+                     _insert_personnel_hours, _personnel_hours_rows)
+    from budget_lines import reconcile
+
+    rng = random.Random(seed)
+    cur = conn.cursor()
+
+    execute_values(
+        cur,
+        "INSERT INTO users (name, email, role, password) VALUES %s ON CONFLICT (email) DO NOTHING",
+        [(f"Bench PI {n}", pi_email(n), "PI", BENCH_PASSWORD) for n in range(1, pis + 1)],
+    )
+    cur.execute("SELECT user_id FROM users WHERE email LIKE %s ORDER BY user_id",
+                (f"%@{BENCH_EMAIL_DOMAIN}",))
+    user_ids = [r[0] for r in cur.fetchall()]
+
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    award_ids = []
+    approved_total = 0
+    for offset in range(0, awards, batch_size):
+        rows = []
+        lists_by_row = []
+        for _ in range(min(batch_size, awards - offset)):
+            email = pi_email(rng.randint(1, pis))
+            form = award_form(rng, email)
+            lists = tuple(json.loads(form[c]) for c in BUDGET_JSON_COLUMNS)
+            status = rng.choices(statuses, weights)[0]
+            created = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 700),
+                                                       seconds=rng.randint(0, 86399))
+            if status == "Approved":
+                approved_total += float(form["amount"])
+            rows.append((
+                email, form["title"], form["sponsor_type"], form["department"], form["college"],
+                form["contact_email"], form["amount"], form["start_date"], form["end_date"],
+                form["abstract"], form["keywords"], form["collaborators"],
+                json.dumps(_budget_json_hashes(lists)),
+                *_form_budget_columns(form, lists).values(),
+                status, created,
+            ))
+            lists_by_row.append(lists)
+        ids = execute_values(
+            cur,
+            """
+            INSERT INTO awards (
+              created_by_email, title, sponsor_type, department, college, contact_email,
+              amount, start_date, end_date, abstract, keywords, collaborators,
+              budget_json_hash, budget_personnel, budget_equipment, budget_travel,
+              budget_materials, total_budget, status, created_at
+            )
+            VALUES %s
+            RETURNING award_id
+            """,
+            rows,
+            fetch=True,
+        )
+        batch_ids = [r[0] for r in ids]
+        award_ids.extend(batch_ids)
+
+        detail = [[] for _ in DETAIL_TABLES]
+        hours = []
+        for award_id, lists in zip(batch_ids, lists_by_row):
+            for out, table_rows in zip(detail, _budget_detail_rows(award_id, *lists)):
+                out.extend(table_rows)
+            hours.extend(_personnel_hours_rows(award_id, lists[0]))
+        for (table, _pk, columns), table_rows in zip(DETAIL_TABLES, detail):
+            _insert_detail_rows(cur, table, columns, table_rows)
+        _insert_personnel_hours(cur, hours)
+        conn.commit()
+
+    # Approved awards are charged to the default pool, which is made large
+    # enough that the approve scenario never runs out of budget
+    cur.execute(
+        """
+        UPDATE budget_pools
+        SET initial_amount = 1e12,
+            committed_amount = committed_amount + %s
+        WHERE name = 'University'
+        RETURNING pool_id
+        """,
+        (approved_total,),
+    )
+    pool_id = cur.fetchone()[0]
+    cur.execute(
+        """
+        UPDATE awards SET budget_pool_id = %s
+        WHERE status = 'Approved' AND budget_pool_id IS NULL AND created_by_email LIKE %s
+        """,
+        (pool_id, f"%@{BENCH_EMAIL_DOMAIN}"),
+    )
+
+    for offset in range(0, transactions, batch_size * 10):
+        rows = []
+        for _ in range(min(batch_size * 10, transactions - offset)):
+            rows.append((
+                rng.choice(award_ids), rng.choice(user_ids),
+                rng.choice(TRANSACTION_CATEGORIES),
+                rng.choice(("Order", "Invoice", "Reimbursement")),
+                round(rng.uniform(5, 9000), 2),
+                date(2024, 1, 1) + timedelta(days=rng.randint(0, 700)),
+                rng.choices(("Pending", "Approved", "Declined"), (2, 7, 1))[0],
+            ))
+        execute_values(
+            cur,
+            """
+            INSERT INTO transactions
+                (award_id, user_id, category, description, amount, date_submitted, status)
+            VALUES %s
+            """,
+            rows,
+        )
+    conn.commit()
+    cur.close()
+    reconcile(conn, fix=True)
+    return {"pis": pis, "awards": len(award_ids), "transactions": transactions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pis", type=int, default=50)
+    parser.add_argument("--awards", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    from db import db_connection
+
+    with db_connection() as conn:
+        counts = generate(conn, args.pis, args.awards, args.transactions, args.seed)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Excel exporter benchmark: legacy openpyxl Workbook vs. write-only + named styles.
+
+Run from the repo root:
+
+    python -m benchmarks.excel_export [--items 200 2000 10000] [--repeat 3]
+
+For each budget size it reports line items written per second and the peak
+Python memory (tracemalloc) of producing the final .xlsx bytes.
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import date
+from io import BytesIO
+
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+from exports import write_award_excel
+
+
+def legacy_award_excel(award, personnel, domestic_travel, international_travel, materials):
+    """The pre-write-only exporter: full Workbook, Border per cell, BytesIO copy."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Grant Budget"
+
+    # Styles
+    header_fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
+    bold = Font(bold=True)
+    center = Alignment(horizontal="center")
+    thin = Side(style="thin", color="000000")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    # Set some decent column widths
+    ws.column_dimensions["A"].width = 20
+    ws.column_dimensions["B"].width = 40
+    ws.column_dimensions["C"].width = 20
+    ws.column_dimensions["D"].width = 20
+    ws.column_dimensions["E"].width = 18
+    ws.column_dimensions["F"].width = 18
+    ws.column_dimensions["G"].width = 12
+    ws.column_dimensions["H"].width = 12
+    ws.column_dimensions["I"].width = 16
+    ws.column_dimensions["J"].width = 10
+
+    row = 1
+
+    def write_kv(label, value):
+        nonlocal row
+        ws.cell(row=row, column=1, value=label).font = bold
+        ws.cell(row=row, column=2, value=value)
+        row += 1
+
+    title = award.get("title") or ""
+    funding = award.get("sponsor_type") or ""
+    amount = float(award.get("amount") or 0)
+    dept = award.get("department") or ""
+    college = award.get("college") or ""
+    email = award.get("contact_email") or award.get("created_by_email") or ""
+    status = award.get("status") or ""
+    start = award.get("start_date")
+    end = award.get("end_date")
+    abstract = award.get("abstract") or ""
+    keywords = award.get("keywords") or ""
+    collaborators = award.get("collaborators") or ""
+
+    write_kv("Title", title)
+    write_kv("Funding Agency", funding)
+    write_kv("Amount", amount)
+    write_kv("Department", dept)
+    write_kv("College", college)
+    write_kv("Contact Email", email)
+    write_kv("Start Date", start)
+    write_kv("End Date", end)
+    write_kv("Status", status)
+    row += 1
+    write_kv("Abstract", abstract)
+    write_kv("Keywords", keywords)
+    write_kv("Collaborators", collaborators)
+
+    row += 2
+
+    # Personnel section
+    if personnel:
+        ws.cell(row=row, column=1, value="Personnel").font = bold
+        row += 1
+        headers = ["Name", "Position", "Hours by Year", "Same Each Year?"]
+        for col, h in enumerate(headers, start=1):
+            cell = ws.cell(row=row, column=col, value=h)
+            cell.font = bold
+            cell.fill = header_fill
+            cell.alignment = center
+            cell.border = border
+        row += 1
+
+        def hours_text(hours_list):
+            if not hours_list:
+                return ""
+            parts = []
+            for h in hours_list:
+                year = h.get("year")
+                hrs = h.get("hours")
+                if year and hrs not in (None, ""):
+                    parts.append(f"{year}: {hrs} hrs")
+            return ", ".join(parts)
+
+        for p in personnel:
+            ws.cell(row=row, column=1, value=p.get("name") or "").border = border
+            ws.cell(row=row, column=2, value=p.get("position") or "").border = border
+            ws.cell(row=row, column=3, value=hours_text(p.get("hours"))).border = border
+            ws.cell(
+                row=row,
+                column=4,
+                value="Yes" if p.get("same_each_year") else "No",
+            ).border = border
+            row += 1
+        row += 2
+
+    # Travel section (domestic + international)
+    if domestic_travel or international_travel:
+        ws.cell(row=row, column=1, value="Travel").font = bold
+        row += 1
+        headers = [
+            "Type", "Year", "Name", "Description",
+            "Departure", "Arrival", "Flight Cost",
+            "Taxi/Day", "Food & Lodge/Day", "Days"
+        ]
+        for col, h in enumerate(headers, start=1):
+            cell = ws.cell(row=row, column=col, value=h)
+            cell.font = bold
+            cell.fill = header_fill
+            cell.alignment = center
+            cell.border = border
+        row += 1
+
+        def add_travel_row(travel_type, t):
+            nonlocal row
+            cols = [
+                travel_type,
+                t.get("year"),
+                t.get("travel_name") or t.get("name") or "",
+                t.get("description") or "",
+                t.get("start_date") or t.get("depart") or "",
+                t.get("end_date") or t.get("arrive") or "",
+                t.get("flight_cost") or t.get("flight") or "",
+                t.get("taxi_per_day") or "",
+                t.get("food_lodge_per_day") or t.get("food_per_day") or "",
+                t.get("days") or t.get("num_days") or "",
+            ]
+            for col, val in enumerate(cols, start=1):
+                cell = ws.cell(row=row, column=col, value=val)
+                cell.border = border
+            row += 1
+
+        for t in domestic_travel:
+            add_travel_row("Domestic", t)
+        for t in international_travel:
+            add_travel_row("International", t)
+        row += 2
+
+    # Materials section
+    if materials:
+        ws.cell(row=row, column=1, value="Materials and Supplies").font = bold
+        row += 1
+        headers = ["Category", "Year", "Description", "Cost"]
+        for col, h in enumerate(headers, start=1):
+            cell = ws.cell(row=row, column=col, value=h)
+            cell.font = bold
+            cell.fill = header_fill
+            cell.alignment = center
+            cell.border = border
+        row += 1
+
+        for m in materials:
+            cols = [
+                m.get("material_type") or m.get("category") or "",
+                m.get("year"),
+                m.get("description") or "",
+                m.get("cost") or "",
+            ]
+            for col, val in enumerate(cols, start=1):
+                cell = ws.cell(row=row, column=col, value=val)
+                cell.border = border
+            row += 1
+
+    # Save to memory and return
+    bio = BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def new_award_excel(award, personnel, domestic_travel, international_travel, materials):
+    out = BytesIO()
+    write_award_excel(out, award, personnel, domestic_travel, international_travel, materials)
+    return out.getvalue()
+
+
+def synthetic_award(n_items):
+    """An award whose budget has roughly n_items line items split over the sections."""
+    years = [2025, 2026, 2027]
+    award = {
+        "award_id": 1, "title": "Benchmark award", "sponsor_type": "NSF",
+        "amount": 1_000_000, "department": "CS", "college": "Engineering",
+        "contact_email": "pi@example.com", "status": "Pending",
+        "start_date": date(2025, 1, 1), "end_date": date(2027, 12, 31),
+        "abstract": "x" * 500, "keywords": "bench", "collaborators": "none",
+    }
+    per = max(1, n_items // 4)
+    personnel = [
+        {"name": f"Person {i}", "position": "Graduate Assistant", "same_each_year": True,
+         "hours": [{"year": y, "hours": 500} for y in years]}
+        for i in range(per)
+    ]
+    travel = [
+        {"name": f"Trip {i}", "description": "Conference", "year": years[i % 3],
+         "depart": "2025-03-01", "arrive": "2025-03-05", "flight": 450.0,
+         "taxi_per_day": 30.0, "food_per_day": 120.0, "days": 4}
+        for i in range(per)
+    ]
+    materials = [
+        {"category": "Lab consumables", "cost": 125.5, "description": "Reagents", "year": years[i % 3]}
+        for i in range(per)
+    ]
+    return award, personnel, travel, list(travel), materials
+
+
+def measure(fn, args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[200, 2000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'impl':>8} {'rows/s':>10} {'seconds':>9} {'peak MiB':>9}")
+    for n in args.items:
+        data = synthetic_award(n)
+        rows = sum(len(section) for section in data[1:])
+        for name, fn in (("legacy", legacy_award_excel), ("stream", new_award_excel)):
+            seconds, peak = measure(fn, data, args.repeat)
+            print(f"{rows:>7} {name:>8} {rows / seconds:>10.0f} {seconds:>9.3f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""Load test: run the request scenarios and record latency percentiles.
+
+Run from the repo root:
+
+    python -m benchmarks.loadtest [--driver client|gunicorn] [--pgserver]
+        [--requests 200] [--concurrency 4] [--scenarios login award_view ...]
+        [--out bench.json] [--compare previous.json]
+
+Every run gets a disposable database. It is created on the server in
+DATABASE_URL (or --database-url), or, with --pgserver, on a throwaway
+local cluster (needs the optional ``pgserver`` package). The database is
+migrated, seeded by benchmarks.datagen with a fixed seed, and dropped at
+the end.
+
+Scenarios go through Flask's test client (``client``, no network or WSGI
+server) or over HTTP against gunicorn workers started for the run
+(``gunicorn``). The app runs with METRICS_DEBUG_HEADER=1, so each response
+reports its SQL statement count and database time. For every scenario the
+JSON report holds p50/p95/p99 latency, throughput, errors and query
+counts, plus the commit it ran on, so runs can be compared with
+--compare.
+"""
+import argparse
+import http.cookiejar
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_EMAIL = "admin@example.com"
+ADMIN_PASSWORD = "adminpassword"
+GUNICORN_START_TIMEOUT = 30
+
+
+# ------------------------------------------------------------------ database
+
+def _with_dbname(url, dbname):
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit(parts._replace(path="/" + dbname))
+
+
+class BenchDatabase:
+    """A database created for one run on ``server_url`` and dropped afterwards."""
+
+    def __init__(self, server_url, keep=False):
+        self.server_url = server_url
+        self.name = f"grantguard_bench_{os.getpid()}"
+        self.url = _with_dbname(server_url, self.name)
+        self.keep = keep
+
+    def _admin(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.server_url)
+        conn.autocommit = True
+        return conn
+
+    def create(self):
+        conn = self._admin()
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{self.name}"')
+            cur.execute(f'CREATE DATABASE "{self.name}"')
+        conn.close()
+
+    def drop(self):
+        if self.keep:
+            print(f"Kept benchmark database {self.url}")
+            return
+        conn = self._admin()
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{self.name}" WITH (FORCE)')
+        conn.close()
+
+
+def _start_pgserver():
+    """(server handle, URL) of a throwaway local Postgres cluster."""
+    if importlib.util.find_spec("pgserver") is None:
+        raise SystemExit("--pgserver needs the pgserver package (pip install pgserver)")
+    import pgserver
+
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="grantguard-pg-"), cleanup_mode="delete")
+    return server, server.get_uri()
+
+
+# ------------------------------------------------------------------- drivers
+
+def _db_stats(headers):
+    """(queries, db_ms) from an X-DB-Stats header, or (None, None)."""
+    value = headers.get("X-DB-Stats")
+    if not value:
+        return None, None
+    fields = dict(part.split("=", 1) for part in value.split())
+    return int(fields["queries"]), float(fields["db_ms"])
+
+
+class _ClientSession:
+    def __init__(self, client):
+        self._client = client
+
+    def request(self, method, path, data=None):
+        resp = self._client.open(path, method=method, data=data)
+        resp.get_data()     # drain streamed bodies inside the timing
+        resp.close()
+        return resp.status_code, resp.headers
+
+
+class ClientDriver:
+    """In-process: Flask test client, no sockets or WSGI server."""
+
+    name = "client"
+
+    def __init__(self):
+        from app import app
+
+        self._app = app
+
+    def session(self):
+        return _ClientSession(self._app.test_client())
+
+    def close(self):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _HttpSession:
+    def __init__(self, base_url):
+        self._base = base_url
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        if method == "POST" and body is None:
+            body = b""
+        req = urllib.request.Request(self._base + path, data=body, method=method)
+        try:
+            with self._opener.open(req) as resp:
+                resp.read()
+                return resp.status, resp.headers
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers
+
+
+class GunicornDriver:
+    """Over HTTP against gunicorn workers serving app:app on a free local port."""
+
+    name = "gunicorn"
+
+    def __init__(self, workers, env):
+        if importlib.util.find_spec("gunicorn") is None:
+            raise SystemExit("--driver gunicorn needs gunicorn (pip install -r requirements.txt)")
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--workers", str(workers),
+             "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+            cwd=ROOT, env=env,
+        )
+        deadline = time.monotonic() + GUNICORN_START_TIMEOUT
+        while True:
+            try:
+                urllib.request.urlopen(self.base_url + "/", timeout=1).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if self._proc.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise SystemExit("gunicorn did not start")
+                time.sleep(0.2)
+
+    def session(self):
+        return _HttpSession(self.base_url)
+
+    def close(self):
+        if self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+
+
+# ------------------------------------------------------------------- running
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+class _Worker:
+    """Per-thread sessions and random stream for one virtual user."""
+
+    def __init__(self, driver, user, seed):
+        from benchmarks.datagen import BENCH_PASSWORD
+
+        self.driver = driver
+        self.user = user
+        self.rng = random.Random(seed)
+        self.sessions = {"pi": driver.session(), "admin": driver.session()}
+        status, _ = self.sessions["pi"].request(
+            "POST", "/login", {"email": user.pi["email"], "password": BENCH_PASSWORD})
+        status_admin, _ = self.sessions["admin"].request(
+            "POST", "/login", {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+        if status != 200 or status_admin != 200:
+            raise SystemExit("Could not log the benchmark users in")
+
+    def run(self, scenario):
+        """(seconds, status, queries, db_ms) for one request, or None if skipped."""
+        req = scenario.build(self.user, self.rng)
+        if req is None:
+            return None
+        method, path, data = req
+        session = self.sessions[scenario.role] if scenario.role else self.driver.session()
+        start = time.perf_counter()
+        status, headers = session.request(method, path, data)
+        elapsed = time.perf_counter() - start
+        return (elapsed, status, *_db_stats(headers))
+
+
+def run_scenario(scenario, workers, requests, warmup):
+    """Run ``warmup`` + ``requests`` requests spread over the workers; returns stats."""
+    def batch(n):
+        counter = iter(range(n))
+        lock = threading.Lock()
+
+        def loop(worker):
+            out = []
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return out
+                out.append(worker.run(scenario))
+
+        with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+            return [r for rs in pool.map(loop, workers) for r in rs]
+
+    batch(warmup)
+    started = time.perf_counter()
+    results = batch(requests)
+    wall = time.perf_counter() - started
+
+    done = [r for r in results if r is not None]
+    latencies = sorted(r[0] * 1000 for r in done)
+    statuses = Counter(r[1] for r in done)
+    queries = [r[2] for r in done if r[2] is not None]
+    db_ms = [r[3] for r in done if r[3] is not None]
+    return {
+        "requests": len(done),
+        "skipped": len(results) - len(done),
+        "errors": sum(n for status, n in statuses.items() if status != scenario.expect),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(len(done) / wall, 2) if wall and done else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50_ms": _round(percentile(latencies, 50)),
+        "p95_ms": _round(percentile(latencies, 95)),
+        "p99_ms": _round(percentile(latencies, 99)),
+        "max_ms": _round(latencies[-1] if latencies else None),
+        "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+        "db_ms_mean": round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    base = (baseline or {}).get("scenarios", {})
+    print(f"{'scenario':<16} {'n':>5} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} "
+          f"{'p99':>8} {'queries':>8}" + (f" {'p95 vs base':>12}" if baseline else ""))
+    for name, s in report["scenarios"].items():
+        line = (f"{name:<16} {s['requests']:>5} {s['errors']:>4} {s['throughput_rps']:>8.1f} "
+                f"{_fmt(s['p50_ms'])} {_fmt(s['p95_ms'])} {_fmt(s['p99_ms'])} "
+                f"{_fmt(s['queries_mean'])}")
+        old = base.get(name, {}).get("p95_ms")
+        if baseline and old and s["p95_ms"] is not None:
+            line += f" {(s['p95_ms'] - old) / old * 100:>+11.1f}%"
+        print(line)
+
+
+def _fmt(value):
+    return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+
+def main(argv=None):
+    from benchmarks.scenarios import SCENARIOS, SCENARIOS_BY_NAME
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--driver", choices=("client", "gunicorn"), default="client")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=4, help="virtual users (threads)")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per scenario")
+    parser.add_argument("--scenarios", nargs="*", choices=sorted(SCENARIOS_BY_NAME),
+                        help="default: all")
+    parser.add_argument("--pis", type=int, default=50)
+    parser.add_argument("--awards", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="server to create the throwaway database on")
+    parser.add_argument("--pgserver", action="store_true",
+                        help="run on a temporary local Postgres cluster instead")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the database")
+    parser.add_argument("--out", help="report path (default bench-<commit>-<driver>.json)")
+    parser.add_argument("--compare", help="previous report to compare p95 latency with")
+    args = parser.parse_args(argv)
+
+    scenarios = [SCENARIOS_BY_NAME[n] for n in args.scenarios] if args.scenarios else list(SCENARIOS)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    pg = None
+    if args.pgserver:
+        pg, server_url = _start_pgserver()
+    elif args.database_url:
+        server_url = args.database_url
+    else:
+        parser.error("set DATABASE_URL / --database-url, or use --pgserver")
+
+    db = BenchDatabase(server_url, keep=args.keep_db)
+    db.create()
+    # db.py and metrics.py read these at import
+    os.environ.update({
+        "DATABASE_URL": db.url,
+        "METRICS_DEBUG_HEADER": "1",
+        "DB_POOL_MAX": str(args.concurrency * 2 + 2),
+    })
+    driver = None
+    try:
+        import app  # noqa: F401
+        from benchmarks.datagen import generate
+        from benchmarks.scenarios import Fixtures, VirtualUser
+        from db import db_connection
+        from migrate import migrate
+
+        started = time.perf_counter()
+        with db_connection() as conn:
+            migrate(conn)
+            dataset = generate(conn, args.pis, args.awards, args.transactions, args.seed)
+            fixtures = Fixtures.load(conn)
+        print(f"Seeded {dataset} in {time.perf_counter() - started:.1f}s")
+        if len(fixtures.pis) < args.concurrency:
+            parser.error("not enough PIs with draft awards for --concurrency; raise --pis/--awards")
+
+        if args.driver == "gunicorn":
+            driver = GunicornDriver(args.workers, dict(os.environ))
+        else:
+            driver = ClientDriver()
+        workers = [
+            _Worker(driver, VirtualUser(fixtures.pis[i], fixtures), args.seed * 1000 + i)
+            for i in range(args.concurrency)
+        ]
+
+        report = {
+            "meta": {
+                "commit": _git("rev-parse", "--short", "HEAD"),
+                "dirty": bool(_git("status", "--porcelain")),
+                "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "driver": driver.name,
+                "workers": args.workers if driver.name == "gunicorn" else None,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "seed": args.seed,
+                "dataset": dataset,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "scenarios": {},
+        }
+        for scenario in scenarios:
+            report["scenarios"][scenario.name] = run_scenario(
+                scenario, workers, args.requests, args.warmup)
+    finally:
+        if driver is not None:
+            driver.close()
+        if "db" in sys.modules:
+            sys.modules["db"].get_pool().closeall()
+        db.drop()
+        if pg is not None:
+            pg.cleanup()
+
+    out = args.out or f"bench-{report['meta']['commit'] or 'unknown'}-{driver.name}.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report, baseline)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Request scenarios for the load test (see benchmarks.loadtest).
+
+Each scenario builds one request for a virtual user. ``role`` picks the
+session it runs in: "pi" (logged in as the user's PI), "admin", or None
+for a fresh anonymous session per request. ``expect`` is the status a
+successful request answers with; anything else counts as an error.
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from benchmarks.datagen import BENCH_PASSWORD, award_form
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    role: Optional[str]
+    expect: int
+    build: Callable     # build(user, rng) -> (method, path, form) or None to skip
+
+
+class Fixtures:
+    """Ids the scenarios pick from, loaded once from the seeded database."""
+
+    def __init__(self, pis, awaiting_approval):
+        self.pis = pis                      # [{"email", "awards", "drafts"}]
+        self._approvals = deque(awaiting_approval)
+        self._lock = threading.Lock()
+
+    def next_approval(self):
+        with self._lock:
+            return self._approvals.popleft() if self._approvals else None
+
+    @classmethod
+    def load(cls, conn):
+        from psycopg2.extras import RealDictCursor
+
+        from benchmarks.datagen import BENCH_EMAIL_DOMAIN
+        from line_items import json_columns
+
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(
+            f"""
+            SELECT award_id, created_by_email, status, title, sponsor_type, department,
+                   college, contact_email, amount, start_date, end_date, abstract,
+                   keywords, collaborators, {json_columns()}
+            FROM awards
+            WHERE created_by_email LIKE %s
+            ORDER BY award_id
+            """,
+            (f"%@{BENCH_EMAIL_DOMAIN}",),
+        )
+        by_pi = {}
+        awaiting = []
+        for row in cur.fetchall():
+            pi = by_pi.setdefault(row["created_by_email"],
+                                  {"email": row["created_by_email"], "awards": [], "drafts": []})
+            pi["awards"].append(row["award_id"])
+            if row["status"] == "Draft":
+                pi["drafts"].append((row["award_id"], _edit_form(row)))
+            elif row["status"] == "AI passed":
+                awaiting.append(row["award_id"])
+        cur.close()
+        conn.rollback()
+        pis = [pi for _, pi in sorted(by_pi.items()) if pi["drafts"]]
+        return cls(pis, awaiting)
+
+
+def _edit_form(row):
+    import json
+
+    form = {
+        key: "" if row[key] is None else str(row[key])
+        for key in ("title", "sponsor_type", "department", "college", "contact_email",
+                    "amount", "start_date", "end_date", "abstract", "keywords",
+                    "collaborators")
+    }
+    for key in ("personnel_json", "domestic_travel_json", "international_travel_json",
+                "materials_json"):
+        form[key] = json.dumps(row[key] or [])
+    return form
+
+
+class VirtualUser:
+    """One load-test thread: a PI identity plus the shared fixtures."""
+
+    def __init__(self, pi, fixtures):
+        self.pi = pi
+        self.fixtures = fixtures
+        self.edits = 0
+
+
+def _login(user, rng):
+    return "POST", "/login", {"email": user.pi["email"], "password": BENCH_PASSWORD}
+
+
+def _dashboard(user, rng):
+    return "GET", "/dashboard", None
+
+
+def _award_view(user, rng):
+    return "GET", f"/awards/{rng.choice(user.pi['awards'])}/view", None
+
+
+def _award_create(user, rng):
+    return "POST", "/awards", award_form(rng, user.pi["email"])
+
+
+def _award_edit(user, rng):
+    award_id, form = rng.choice(user.pi["drafts"])
+    user.edits += 1
+    return "POST", f"/awards/{award_id}/edit", dict(form, title=f"{form['title']} (rev {user.edits})")
+
+
+def _approve(user, rng):
+    award_id = user.fixtures.next_approval()
+    if award_id is None:
+        return None
+    return "POST", f"/awards/{award_id}/approve", None
+
+
+def _portfolio(user, rng):
+    return "GET", "/admin/portfolio", None
+
+
+def _export(fmt):
+    def build(user, rng):
+        return "GET", f"/awards/{rng.choice(user.pi['awards'])}/download/{fmt}", None
+    return build
+
+
+SCENARIOS = (
+    Scenario("login", None, 200, _login),
+    Scenario("dashboard_pi", "pi", 200, _dashboard),
+    Scenario("dashboard_admin", "admin", 200, _dashboard),
+    Scenario("award_view", "pi", 200, _award_view),
+    Scenario("award_create", "pi", 302, _award_create),
+    Scenario("award_edit", "pi", 302, _award_edit),
+    Scenario("approve", "admin", 302, _approve),
+    Scenario("portfolio", "admin", 200, _portfolio),
+    Scenario("export_pdf", "pi", 200, _export("pdf")),
+    Scenario("export_excel", "pi", 200, _export("excel")),
+)
+SCENARIOS_BY_NAME = {s.name: s for s in SCENARIOS}
@@ -0,0 +1,82 @@
+"""Worker startup benchmark: cold ``import app`` time and resident memory.
+
+Run from the repo root:
+
+    python -m benchmarks.startup [--runs 5]
+
+Each run imports the app in a fresh interpreter (as a gunicorn worker
+would without --preload), once with the export renderers loaded lazily
+(default) and once with EXPORT_PRELOAD=1, and reports the median import
+time, the RSS after import, and the time of the first Excel render (which
+pays the deferred import in lazy mode). Schema migration is switched off
+so no database is needed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+
+def rss_kib():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+rss = rss_kib()
+heavy = sorted(m for m in ("openpyxl", "reportlab") if m in sys.modules)
+from io import BytesIO
+award = {"award_id": 1, "title": "Startup benchmark", "status": "Draft"}
+materials = [{"category": "Supplies", "year": 2025, "cost": 100.0}]
+start = time.perf_counter()
+app._write_award_excel(BytesIO(), award, [], [], [], materials)
+first_render = time.perf_counter() - start
+print(json.dumps({
+    "import_s": imported,
+    "rss_kib": rss,
+    "first_render_s": first_render,
+    "heavy_loaded": heavy,
+}))
+"""
+
+MODES = (("lazy", {"EXPORT_PRELOAD": "0"}), ("preload", {"EXPORT_PRELOAD": "1"}))
+
+
+def probe(extra_env):
+    env = dict(os.environ, DB_AUTO_MIGRATE="0", **extra_env)
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE], env=env, check=True,
+        capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':>8} {'import ms':>10} {'RSS MiB':>8} {'1st xlsx ms':>12}  loaded at startup")
+    for name, env in MODES:
+        runs = [probe(env) for _ in range(args.runs)]
+        import_ms = statistics.median(r["import_s"] for r in runs) * 1000
+        rss_mib = statistics.median(r["rss_kib"] for r in runs) / 1024
+        render_ms = statistics.median(r["first_render_s"] for r in runs) * 1000
+        loaded = ", ".join(runs[0]["heavy_loaded"]) or "-"
+        print(f"{name:>8} {import_ms:>10.0f} {rss_mib:>8.1f} {render_ms:>12.0f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Year x category budget totals computed from an award's line-item lists.
+
+    python budget_calc.py --backfill     # fill the summary columns of old awards
+
+Every line item is flattened to (year, category, a, b, c) with value
+a + b * c -- travel: flight + (taxi + food/lodging per day) x days;
+materials: cost; personnel: hours -- so one vectorized expression values
+all of them and ``np.bincount`` sums them into a year x column matrix.
+``portfolio_totals`` does the same over any number of awards at once;
+``stored_items_sql`` values stored awards with the same formula in SQL,
+straight from the detail tables.
+
+Personnel is reported in hours and left out of the priced total: the form
+collects no rate to price them with, so awards.budget_personnel stays
+NULL. Priced categories follow the other awards.budget_* columns;
+materials whose type starts with "Equipment" count as equipment.
+"""
+import argparse
+from decimal import Decimal
+
+import numpy as np
+
+BUDGET_CATEGORIES = ("equipment", "travel", "materials")
+# awards summary columns: budget_personnel (always NULL, see above), one
+# per priced category, and the grand total
+SUMMARY_COLUMNS = (("budget_personnel",) + tuple(f"budget_{c}" for c in BUDGET_CATEGORIES)
+                   + ("total_budget",))
+
+# Matrix columns: the priced categories, then personnel hours
+_EQUIPMENT, _TRAVEL, _MATERIALS, _HOURS = range(len(BUDGET_CATEGORIES) + 1)
+_COLUMNS = _HOURS + 1
+_NO_YEAR = -1
+# Awards recomputed per statement by backfill()
+BACKFILL_BATCH_SIZE = 2000
+
+
+def _number(value):
+    try:
+        return float(value) if value not in (None, "", "null") else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _year(value):
+    try:
+        return int(float(value)) if value not in (None, "", "null") else _NO_YEAR
+    except (TypeError, ValueError):
+        return _NO_YEAR
+
+
+def _flatten(personnel, domestic_travel, international_travel, materials, out):
+    """Append one (year, category, a, b, c) per line item to ``out``."""
+    for p in personnel or ():
+        if not isinstance(p, dict):
+            continue
+        for h in p.get("hours") or ():
+            if isinstance(h, dict):
+                out.append((_year(h.get("year")), _HOURS, _number(h.get("hours")), 0.0, 0.0))
+    for trips in (domestic_travel, international_travel):
+        for t in trips or ():
+            if not isinstance(t, dict):
+                continue
+            out.append((
+                _year(t.get("year")), _TRAVEL,
+                _number(t.get("flight_cost") or t.get("flight")),
+                _number(t.get("taxi_per_day"))
+                + _number(t.get("food_lodge_per_day") or t.get("food_per_day")),
+                _number(t.get("days") or t.get("num_days")),
+            ))
+    for m in materials or ():
+        if not isinstance(m, dict):
+            continue
+        mtype = (m.get("material_type") or m.get("category") or "").strip().lower()
+        category = _EQUIPMENT if mtype.startswith("equipment") else _MATERIALS
+        out.append((_year(m.get("year")), category, _number(m.get("cost")), 0.0, 0.0))
+
+
+def _price(items):
+    """(years, categories, amounts) arrays for flattened items."""
+    if not items:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float64))
+    arr = np.asarray(items, dtype=np.float64)
+    return arr[:, 0].astype(np.int64), arr[:, 1].astype(np.int64), arr[:, 2] + arr[:, 3] * arr[:, 4]
+
+
+def _period_years(start_date, end_date):
+    if start_date and end_date and end_date >= start_date:
+        return list(range(start_date.year, end_date.year + 1))
+    return []
+
+
+class AwardBudget:
+    """
+    Year x category totals, of one award or a summary of many:
+    ``amounts[i, j]`` is year ``years[i]``, category j, and ``hours[i]``
+    the personnel hours that year.
+    """
+
+    def __init__(self, years, amounts, hours):
+        self.years = years
+        self.amounts = amounts
+        self.hours = hours
+
+    @property
+    def by_category(self):
+        return dict(zip(BUDGET_CATEGORIES, self.amounts.sum(axis=0).tolist()))
+
+    @property
+    def by_year(self):
+        return dict(zip(self.years, self.amounts.sum(axis=1).tolist()))
+
+    @property
+    def total(self):
+        return float(self.amounts.sum())
+
+    @property
+    def total_hours(self):
+        return float(self.hours.sum())
+
+    def rows(self):
+        """[(year or None, hours, [amount per category], year total)] for templates/exports."""
+        return [
+            (None if year == _NO_YEAR else year, float(hours), row.tolist(), float(row.sum()))
+            for year, hours, row in zip(self.years, self.hours, self.amounts)
+        ]
+
+    def summary_columns(self):
+        """awards column -> Decimal (None for budget_personnel) for SUMMARY_COLUMNS."""
+        values = [None] + self.amounts.sum(axis=0).tolist() + [self.total]
+        return {
+            column: None if value is None else Decimal(f"{value:.2f}")
+            for column, value in zip(SUMMARY_COLUMNS, values)
+        }
+
+
+def compute_budget(personnel, domestic_travel, international_travel, materials,
+                   start_date=None, end_date=None):
+    """
+    AwardBudget for one award's lists. Years span the award period plus any
+    year a line item names; items without a year count toward the first.
+    """
+    items = []
+    _flatten(personnel, domestic_travel, international_travel, materials, items)
+    years, categories, amounts = _price(items)
+
+    axis = sorted(set(_period_years(start_date, end_date)) | set(years[years != _NO_YEAR].tolist()))
+    if not axis:
+        axis = [start_date.year] if start_date else [_NO_YEAR]
+    years = np.where(years == _NO_YEAR, axis[0], years)
+    year_index = np.searchsorted(axis, years)
+
+    matrix = np.bincount(
+        year_index * _COLUMNS + categories, weights=amounts, minlength=len(axis) * _COLUMNS
+    ).reshape(len(axis), _COLUMNS)
+    return AwardBudget(axis, matrix[:, :_HOURS], matrix[:, _HOURS])
+
+
+def award_budget(award, lists):
+    """compute_budget for an award row and its parsed JSON lists."""
+    return compute_budget(*lists, start_date=award.get("start_date"), end_date=award.get("end_date"))
+
+
+class PortfolioTotals:
+    """Per-award and per-year category totals (and hours) over many awards."""
+
+    def __init__(self, award_ids, by_award, years, by_year):
+        self.award_ids = award_ids              # row order of by_award
+        self.by_award = by_award[:, :_HOURS]    # (n_awards, n_categories)
+        self.hours_by_award = by_award[:, _HOURS]
+        self.years = years                      # row order of by_year
+        self.by_year = by_year[:, :_HOURS]      # (n_years, n_categories)
+        self.hours_by_year = by_year[:, _HOURS]
+
+    @property
+    def by_category(self):
+        return dict(zip(BUDGET_CATEGORIES, self.by_award.sum(axis=0).tolist()))
+
+    @property
+    def total(self):
+        return float(self.by_award.sum())
+
+    @property
+    def total_hours(self):
+        return float(self.hours_by_award.sum())
+
+    def year_rows(self):
+        """[(year, hours, [amount per category], year total)]; undated items last as None."""
+        return [
+            (None if year == _NO_YEAR else year, float(hours), row.tolist(), float(row.sum()))
+            for year, hours, row in sorted(
+                zip(self.years, self.hours_by_year, self.by_year),
+                key=lambda r: (r[0] == _NO_YEAR, r[0]),
+            )
+        ]
+
+
+def portfolio_totals(awards):
+    """
+    Totals for an iterable of (award_id, start_date, personnel,
+    domestic_travel, international_travel, materials): every award's items
+    are flattened into one set of arrays and summed with a single bincount
+    per axis. Undated items count toward their award's start year.
+    """
+    award_ids = []
+    starts = []
+    items = []
+    owners = []
+    for award_id, start_date, *lists in awards:
+        before = len(items)
+        _flatten(*lists, out=items)
+        owners.extend([len(award_ids)] * (len(items) - before))
+        award_ids.append(award_id)
+        starts.append(start_date.year if start_date else _NO_YEAR)
+
+    years, categories, amounts = _price(items)
+    return _portfolio(award_ids, starts, np.asarray(owners, dtype=np.int64),
+                      years, categories, amounts)
+
+
+def stored_items_sql(where="TRUE"):
+    """
+    SQL for (award_id, year, category, amount): the stored line items of
+    the awards matching ``where`` (SQL over ``awards a``), valued like
+    ``_flatten``. Category is an index into BUDGET_CATEGORIES, or
+    len(BUDGET_CATEGORIES) for personnel hours; undated items take the
+    award's start year, or -1 without one.
+    """
+    return f"""
+        SELECT i.award_id,
+               COALESCE(i.year, EXTRACT(YEAR FROM a.start_date)::int, {_NO_YEAR}) AS year,
+               i.category, i.amount
+        FROM awards a
+        JOIN (
+            SELECT p.award_id, h.year, {_HOURS} AS category, h.hours AS amount
+            FROM personnel_expenses p
+            JOIN personnel_hours h USING (personnel_id)
+            UNION ALL
+            SELECT t.award_id, t.year, {_TRAVEL},
+                   COALESCE(t.flight_cost, 0)
+                   + (COALESCE(t.taxi_per_day, 0) + COALESCE(t.food_lodge_per_day, 0))
+                     * COALESCE(t.num_days, 0)
+            FROM travel_expenses t
+            UNION ALL
+            SELECT m.award_id, m.year,
+                   CASE WHEN starts_with(lower(trim(m.material_type)), 'equipment')
+                        THEN {_EQUIPMENT} ELSE {_MATERIALS} END,
+                   COALESCE(m.cost, 0)
+            FROM material_supplies m
+        ) i ON i.award_id = a.award_id
+        WHERE {where}
+    """
+
+
+def stored_portfolio_totals(cur, where="TRUE", params=None):
+    """
+    portfolio_totals for the stored awards matching ``where`` (SQL over
+    ``awards a`` with %(name)s parameters), valued in the database from the
+    detail tables: no per-award lists are built, only one row per award,
+    year and category comes back.
+    """
+    params = params or {}
+    cur.execute(
+        f"SELECT a.award_id, a.start_date FROM awards a WHERE {where} ORDER BY a.award_id",
+        params,
+    )
+    awards = cur.fetchall()
+    award_ids = [r[0] for r in awards]
+    starts = [r[1].year if r[1] else _NO_YEAR for r in awards]
+
+    cur.execute(
+        f"""
+        SELECT award_id, year, category, SUM(amount)::float8
+        FROM ({stored_items_sql(where)}) items
+        GROUP BY 1, 2, 3
+        """,
+        params,
+    )
+    rows = cur.fetchall()
+    if not rows or not award_ids:
+        empty = np.zeros(0, dtype=np.int64)
+        return _portfolio(award_ids, starts, empty, empty, empty, np.zeros(0))
+    ids, years, categories, amounts = zip(*rows)
+    ids, years, categories = (np.asarray(c, dtype=np.int64) for c in (ids, years, categories))
+    amounts = np.asarray(amounts, dtype=np.float64)
+    sorted_ids = np.asarray(award_ids, dtype=np.int64)
+    owners = np.minimum(np.searchsorted(sorted_ids, ids), len(award_ids) - 1)
+    # Awards created between the two statements are left out
+    known = sorted_ids[owners] == ids
+    return _portfolio(award_ids, starts, owners[known], years[known],
+                      categories[known], amounts[known])
+
+
+def _portfolio(award_ids, starts, owners, years, categories, amounts):
+    """PortfolioTotals from valued items; owners index award_ids."""
+    n_awards = len(award_ids)
+
+    by_award = np.bincount(
+        owners * _COLUMNS + categories, weights=amounts, minlength=n_awards * _COLUMNS
+    ).reshape(n_awards, _COLUMNS)
+
+    if n_awards:
+        years = np.where(years == _NO_YEAR, np.asarray(starts, dtype=np.int64)[owners], years)
+    axis, year_index = np.unique(years, return_inverse=True)
+    by_year = np.bincount(
+        year_index * _COLUMNS + categories, weights=amounts, minlength=len(axis) * _COLUMNS
+    ).reshape(len(axis), _COLUMNS)
+    return PortfolioTotals(award_ids, by_award, axis.tolist(), by_year)
+
+
+def backfill(conn, only_missing=True, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Recompute the summary columns of stored awards (by default only those
+    still NULL) batch by batch. Returns the number of awards updated.
+    """
+    from psycopg2.extras import execute_values
+
+    cur = conn.cursor()
+    updated = 0
+    last_id = 0
+    while True:
+        cur.execute(
+            f"""
+            SELECT award_id FROM awards
+            WHERE award_id > %s {'AND total_budget IS NULL' if only_missing else ''}
+            ORDER BY award_id
+            LIMIT %s
+            """,
+            (last_id, batch_size),
+        )
+        batch = [r[0] for r in cur.fetchall()]
+        if not batch:
+            break
+        last_id = batch[-1]
+        totals = stored_portfolio_totals(cur, "a.award_id = ANY(%(ids)s)", {"ids": batch})
+        rows = [
+            (award_id, None, *(round(v, 2) for v in amounts), round(sum(amounts), 2))
+            for award_id, amounts in zip(totals.award_ids, totals.by_award.tolist())
+        ]
+        execute_values(
+            cur,
+            f"""
+            UPDATE awards AS a
+            SET {", ".join(f"{c} = v.{c}" for c in SUMMARY_COLUMNS)}
+            FROM (VALUES %s) AS v(award_id, {", ".join(SUMMARY_COLUMNS)})
+            WHERE a.award_id = v.award_id
+            """,
+            rows,
+            template="(%s" + ", %s::numeric" * len(SUMMARY_COLUMNS) + ")",
+        )
+        conn.commit()
+        updated += len(rows)
+    cur.close()
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Award budget totals")
+    parser.add_argument("--backfill", action="store_true",
+                        help="fill budget_* / total_budget for awards that have none")
+    parser.add_argument("--all", action="store_true",
+                        help="with --backfill, recompute every award")
+    args = parser.parse_args(argv)
+    if not args.backfill:
+        parser.error("nothing to do (use --backfill)")
+
+    from db import db_connection
+
+    with db_connection() as conn:
+        n = backfill(conn, only_missing=not args.all)
+    print(f"Updated budget totals of {n} awards")
+
+
+if __name__ == "__main__":
+    main()
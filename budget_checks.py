@@ -0,0 +1,191 @@
+"""Consistency checks run on an award before it enters the review queue.
+
+    python budget_checks.py          # re-validate the awards awaiting review
+
+An award is submittable only if:
+  - it has a period (start_date <= end_date) and a declared amount;
+  - its itemized budget is not empty, and its priced part (equipment,
+    travel and materials: awards.total_budget, kept by budget_calc on
+    save) does not exceed the declared amount by more than
+    BUDGET_AMOUNT_TOLERANCE. Personnel comes in hours with no rate, so
+    the declared amount may be anything above that;
+  - every personnel / travel / materials year, and every trip's dates, fall
+    inside the award period.
+
+All checks for any number of awards are one query over the precomputed
+totals and the detail tables, so the batch mode costs about the same as a
+single submit. Awards saved before budget_calc existed (total_budget NULL)
+are totalled from their line items on the fly.
+"""
+import json
+import os
+from decimal import Decimal
+
+import portfolio
+from budget_calc import award_budget
+from line_items import json_expressions
+
+# How far the priced items may exceed the declared amount, as a fraction of
+# the declared amount (the itemized budget may round per line)
+BUDGET_AMOUNT_TOLERANCE = Decimal(os.getenv("BUDGET_AMOUNT_TOLERANCE", "0.01"))
+# Statuses of submitted awards still waiting for a decision
+REVIEW_QUEUE_STATUSES = ("Pending", "AI passed", "AI flagged")
+
+_CHECK_SQL = f"""
+    SELECT a.award_id, a.amount, a.total_budget, a.start_date, a.end_date,
+           ARRAY(
+               SELECT DISTINCT y FROM (
+                   SELECT t.year AS y FROM travel_expenses t WHERE t.award_id = a.award_id
+                   UNION ALL
+                   SELECT m.year FROM material_supplies m WHERE m.award_id = a.award_id
+                   UNION ALL
+                   SELECT h.year FROM personnel_expenses p
+                   JOIN personnel_hours h USING (personnel_id)
+                   WHERE p.award_id = a.award_id
+               ) years
+               WHERE y IS NOT NULL AND (
+                   y < EXTRACT(YEAR FROM a.start_date) OR y > EXTRACT(YEAR FROM a.end_date))
+               ORDER BY y
+           ) AS years_outside,
+           EXISTS (
+               SELECT 1 FROM personnel_expenses p
+               JOIN personnel_hours h USING (personnel_id)
+               WHERE p.award_id = a.award_id AND h.hours > 0
+           ) AS has_hours,
+           ARRAY(
+               SELECT COALESCE(t.travel_name, 'unnamed trip') FROM travel_expenses t
+               WHERE t.award_id = a.award_id
+                 AND (t.start_date < a.start_date OR t.end_date > a.end_date
+                      OR t.end_date < t.start_date)
+               ORDER BY 1
+           ) AS trips_outside,
+           {", ".join(f"CASE WHEN a.total_budget IS NULL THEN {expr} END"
+                      for expr in json_expressions("a"))}
+    FROM awards a
+    WHERE a.award_id = ANY(%s)
+    ORDER BY a.award_id
+"""
+
+
+def _issues(row):
+    """Human-readable problems for one _CHECK_SQL row (empty if none)."""
+    (award_id, amount, total, start, end, years_outside, has_hours, trips_outside, *lists) = row
+    issues = []
+    if not start or not end:
+        issues.append("The award has no start or end date.")
+    elif end < start:
+        issues.append("The end date is before the start date.")
+    if not amount or amount <= 0:
+        issues.append("The declared amount is missing.")
+
+    if total is None:
+        budget = award_budget({"start_date": start, "end_date": end},
+                              [v if isinstance(v, list) else [] for v in lists])
+        total = Decimal(f"{budget.total:.2f}")
+        has_hours = budget.total_hours > 0
+    if total <= 0 and not has_hours:
+        issues.append("The itemized budget is empty.")
+    elif amount and amount > 0 and total - amount > amount * BUDGET_AMOUNT_TOLERANCE:
+        issues.append(
+            f"Itemized equipment, travel and materials (${total:,.2f}) exceed the "
+            f"declared amount ${amount:,.2f}."
+        )
+
+    if start and end and end >= start:
+        if years_outside:
+            issues.append(
+                f"Line items fall in {', '.join(map(str, years_outside))}, outside the "
+                f"award period {start.year}-{end.year}."
+            )
+        if trips_outside:
+            issues.append(
+                f"Trip dates outside the award period: {', '.join(trips_outside)}."
+            )
+    return issues
+
+
+def check_awards(cur, award_ids):
+    """{award_id: [issue, ...]} for the given awards."""
+    # Plain tuples whatever cursor factory the caller uses
+    cur = cur.connection.cursor()
+    cur.execute(_CHECK_SQL, (list(award_ids),))
+    result = {row[0]: _issues(row) for row in cur.fetchall()}
+    cur.close()
+    return result
+
+
+def check_award(cur, award_id):
+    """Issues for one award ([] when it is fine to submit)."""
+    return check_awards(cur, [award_id]).get(award_id, [])
+
+
+def record_issues(cur, issues_by_award):
+    """Store each award's issues in awards.validation_errors (NULL if none)."""
+    if not issues_by_award:
+        return
+    from psycopg2.extras import execute_values
+
+    execute_values(
+        cur,
+        """
+        UPDATE awards AS a SET validation_errors = v.errors::jsonb
+        FROM (VALUES %s) AS v(award_id, errors)
+        WHERE a.award_id = v.award_id
+        """,
+        [(award_id, json.dumps(issues) if issues else None)
+         for award_id, issues in sorted(issues_by_award.items())],
+    )
+
+
+def revalidate_pending(conn, progress=None):
+    """
+    Re-run the checks on every award awaiting review (e.g. after a rule
+    change) and send the failing ones back to Draft with their issues.
+    Commits.
+    """
+    cur = conn.cursor()
+    try:
+        # Lock the queue against reviews and decisions while we decide
+        cur.execute(
+            "SELECT award_id FROM awards WHERE status = ANY(%s) ORDER BY award_id FOR UPDATE",
+            (list(REVIEW_QUEUE_STATUSES),),
+        )
+        pending = [r[0] for r in cur.fetchall()]
+        issues = check_awards(cur, pending) if pending else {}
+        failed = sorted(award_id for award_id, found in issues.items() if found)
+        record_issues(cur, issues)
+        if failed:
+            # A Draft leaves the submitted budget totals (portfolio_budget_years)
+            before = {award_id: portfolio.footprint(cur, award_id) for award_id in failed}
+            cur.execute(
+                """
+                UPDATE awards SET status = 'Draft', updated_at = CURRENT_TIMESTAMP
+                WHERE award_id = ANY(%s)
+                """,
+                (failed,),
+            )
+            for award_id in failed:
+                portfolio.record_change(cur, award_id, before[award_id],
+                                        portfolio.footprint(cur, award_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    if progress:
+        progress(len(pending), len(pending))
+    return {"checked": len(pending), "returned_to_draft": failed}
+
+
+def main():
+    from db import db_connection
+
+    with db_connection() as conn:
+        result = revalidate_pending(conn)
+    print(f"Checked {result['checked']} awards awaiting review; "
+          f"{len(result['returned_to_draft'])} returned to Draft")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Per-award, per-category spend rollups (the budget_lines table).
+
+``spent_amount`` is the sum of an award's Approved transactions in that
+category. It is never computed at read time: writers that change
+transactions record (award_id, category, delta, spent_on) rows in the
+``spend_deltas`` temp table and call ``apply_spend_deltas`` before
+committing, so the rollup -- and the portfolio summaries, see
+portfolio.py -- moves in the same database transaction as the charges.
+``reconcile`` recomputes everything from ``transactions`` and reports
+(optionally fixes, portfolio summaries included) any drift.
+"""
+from psycopg2.extras import execute_values
+
+import portfolio
+
+# How many drifted lines a reconciliation report lists
+RECONCILE_REPORT_LIMIT = 100
+
+
+def create_delta_table(cur):
+    """Temp table the caller fills with spend deltas; dropped at commit."""
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS spend_deltas (
+            award_id INTEGER,
+            category VARCHAR(100),
+            delta DECIMAL(14,2),
+            spent_on DATE                -- the transaction's date_submitted
+        ) ON COMMIT DROP
+        """
+    )
+
+
+def apply_spend_deltas(cur):
+    """
+    Fold spend_deltas into budget_lines (one upsert per award/category,
+    in key order so concurrent writers lock rows in the same order) and
+    the portfolio summaries. Returns the number of budget lines touched.
+    """
+    cur.execute(
+        """
+        INSERT INTO budget_lines (award_id, category, allocated_amount, spent_amount)
+        SELECT award_id, category, 0, SUM(delta)
+        FROM spend_deltas
+        GROUP BY award_id, category
+        HAVING SUM(delta) <> 0
+        ORDER BY award_id, category
+        ON CONFLICT (award_id, category) DO UPDATE
+        SET spent_amount = budget_lines.spent_amount + EXCLUDED.spent_amount,
+            updated_at = CURRENT_TIMESTAMP
+        """
+    )
+    touched = cur.rowcount
+    portfolio.apply_spend_deltas(cur)
+    cur.execute("DELETE FROM spend_deltas")
+    return touched
+
+
+def set_allocation(cur, award_id, category, allocated_amount):
+    """Create or update the allocated amount of one budget line."""
+    cur.execute(
+        """
+        INSERT INTO budget_lines (award_id, category, allocated_amount, spent_amount)
+        VALUES (%s, %s, %s, 0)
+        ON CONFLICT (award_id, category) DO UPDATE
+        SET allocated_amount = EXCLUDED.allocated_amount,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        (award_id, category, allocated_amount),
+    )
+
+
+def award_budget_lines(cur, award_id):
+    """[{category, allocated, spent, remaining}] for one award."""
+    cur.execute(
+        """
+        SELECT category,
+               COALESCE(allocated_amount, 0) AS allocated,
+               COALESCE(spent_amount, 0) AS spent,
+               COALESCE(allocated_amount, 0) - COALESCE(spent_amount, 0) AS remaining
+        FROM budget_lines
+        WHERE award_id = %s
+        ORDER BY category
+        """,
+        (award_id,),
+    )
+    return cur.fetchall()
+
+
+def category_totals(cur):
+    """Allocated / spent / remaining per category across all awards."""
+    cur.execute(
+        """
+        SELECT category,
+               COUNT(*) AS awards,
+               COALESCE(SUM(allocated_amount), 0) AS allocated,
+               COALESCE(SUM(spent_amount), 0) AS spent,
+               COALESCE(SUM(allocated_amount), 0) - COALESCE(SUM(spent_amount), 0) AS remaining
+        FROM budget_lines
+        GROUP BY category
+        ORDER BY category
+        """
+    )
+    return cur.fetchall()
+
+
+def reconcile(conn, fix=False, limit=RECONCILE_REPORT_LIMIT):
+    """
+    Recompute spent_amount from Approved transactions and compare it with
+    budget_lines. With ``fix`` the recomputed values are written back and
+    the portfolio summaries, which roll up the same spend, are rebuilt in
+    the same transaction. Commits (or rolls back) ``conn`` and returns a
+    report dict.
+    """
+    portfolio_report = None
+    cur = conn.cursor()
+    try:
+        # Writers update budget_lines last, right before they commit; this
+        # waits for in-flight ones and holds new ones off until we are done
+        cur.execute("LOCK TABLE budget_lines IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute("SELECT COUNT(*) FROM budget_lines")
+        lines = cur.fetchone()[0]
+        cur.execute(
+            """
+            SELECT COALESCE(b.award_id, t.award_id),
+                   COALESCE(b.category, t.category),
+                   COALESCE(b.spent_amount, 0) AS recorded,
+                   COALESCE(t.spent, 0) AS actual
+            FROM budget_lines b
+            FULL OUTER JOIN (
+                SELECT award_id, category, SUM(amount) AS spent
+                FROM transactions
+                WHERE status = 'Approved'
+                GROUP BY award_id, category
+            ) t ON t.award_id = b.award_id AND t.category = b.category
+            WHERE COALESCE(b.spent_amount, 0) <> COALESCE(t.spent, 0)
+            ORDER BY abs(COALESCE(b.spent_amount, 0) - COALESCE(t.spent, 0)) DESC
+            """
+        )
+        drift = cur.fetchall()
+
+        if fix and drift:
+            execute_values(
+                cur,
+                """
+                INSERT INTO budget_lines (award_id, category, allocated_amount, spent_amount)
+                VALUES %s
+                ON CONFLICT (award_id, category) DO UPDATE
+                SET spent_amount = EXCLUDED.spent_amount,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                sorted((award_id, category, 0, actual)
+                       for award_id, category, _recorded, actual in drift),
+            )
+        if fix:
+            portfolio_report = portfolio.rebuild(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return {
+        "lines_checked": lines,
+        "drifted": len(drift),
+        "total_abs_drift": float(sum(abs(actual - recorded) for _, _, recorded, actual in drift)),
+        "fixed": bool(fix and drift),
+        "portfolio": portfolio_report,
+        "drift": [
+            {"award_id": award_id, "category": category,
+             "recorded": float(recorded), "actual": float(actual)}
+            for award_id, category, recorded, actual in drift[:limit]
+        ],
+    }
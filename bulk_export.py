@@ -0,0 +1,92 @@
+"""Streaming building blocks for multi-award exports.
+
+Nothing here holds the whole export in memory: documents are rendered a
+bounded window at a time and written straight into a ZIP whose bytes are
+yielded as they are produced, and the consolidated workbook is built with
+an openpyxl write-only sheet spooled to a temp file and streamed back out.
+"""
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BULK_EXPORT_WORKERS = int(os.getenv("BULK_EXPORT_WORKERS", "4"))
+# Bytes per chunk when streaming the consolidated workbook
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object; zipfile then streams entries."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def bounded_map(fn, items, workers=BULK_EXPORT_WORKERS, window=None):
+    """
+    Like executor.map, but reads ``items`` lazily and keeps at most
+    ``window`` results in flight, so memory does not grow with the input.
+    Yields (item, fn(item)) in input order.
+    """
+    window = window or workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append((item, pool.submit(fn, item)))
+            if len(pending) >= window:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+
+
+def stream_zip(items, render, filename, workers=BULK_EXPORT_WORKERS):
+    """Yield a ZIP archive chunk by chunk, one rendered document per item."""
+    sink = _ChunkSink()
+    # Documents are already compressed (PDF streams, XLSX is a zip itself)
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for item, data in bounded_map(render, items, workers):
+            zf.writestr(filename(item), data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
+
+
+def stream_workbook(headers, rows, sheet_title="Line Items"):
+    """Yield an .xlsx file built from an iterable of rows, in fixed-size chunks."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+
+    with tempfile.TemporaryFile(suffix=".xlsx") as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,201 @@
+"""Bounded cache for rendered award exports (PDF / Excel).
+
+Entries are keyed by (award_id, version, format), where the version is a
+hash of the award row including its JSON budget blobs, so a changed award
+can never be served a stale document -- even from another worker's cache.
+``invalidate`` just frees the space early when an award is mutated.
+
+The in-process tier is an LRU bounded by total bytes. Setting
+EXPORT_CACHE_DIR adds an on-disk tier shared by all workers on the host,
+bounded by EXPORT_CACHE_DIR_MAX_BYTES: files are touched when read and the
+least recently used ones are deleted once the directory outgrows it.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger documents are streamed to the client and never cached
+EXPORT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("EXPORT_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR") or None
+EXPORT_CACHE_DIR_MAX_BYTES = int(os.getenv("EXPORT_CACHE_DIR_MAX_BYTES", str(1024 * 1024 * 1024)))
+# The directory is pruned each time a worker has written this share of its cap
+PRUNE_EVERY_FRACTION = 0.05
+# Half-written temp files older than this are from a crashed writer
+STALE_PART_SECONDS = 3600
+
+# Bump when the PDF/Excel layout changes so old renders are not reused
+EXPORT_FORMAT_VERSION = "3"
+
+
+def prune_directory(directory, max_bytes, max_age=None):
+    """
+    Delete cache files in ``directory`` older than ``max_age`` seconds (by
+    mtime), then the least recently modified ones until the rest fit in
+    ``max_bytes``. Returns the number of files removed.
+    """
+    files = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".part"):
+                    # A write in progress, or a crashed writer's leftover
+                    if st.st_mtime < time.time() - STALE_PART_SECONDS:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+                    continue
+                if entry.is_file():
+                    files.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return 0
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    cutoff = time.time() - max_age if max_age is not None else None
+    removed = 0
+    for mtime, size, path in files:
+        if total <= max_bytes and (cutoff is None or mtime >= cutoff):
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    return removed
+
+
+def award_version(award):
+    """Stable hash of an award row (all columns, JSON blobs included)."""
+    payload = json.dumps(award, sort_keys=True, default=str)
+    return hashlib.sha1(f"{EXPORT_FORMAT_VERSION}:{payload}".encode()).hexdigest()
+
+
+class ExportCache:
+    def __init__(self, max_bytes=EXPORT_CACHE_MAX_BYTES, directory=EXPORT_CACHE_DIR,
+                 max_entry_bytes=EXPORT_CACHE_MAX_ENTRY_BYTES,
+                 dir_max_bytes=EXPORT_CACHE_DIR_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.directory = directory
+        self.dir_max_bytes = dir_max_bytes
+        self._written = 0               # bytes written to the directory since the last prune
+        self._entries = OrderedDict()   # (award_id, version, fmt) -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            prune_directory(directory, dir_max_bytes)
+
+    def _path(self, key):
+        award_id, version, fmt = key
+        return os.path.join(self.directory, f"{award_id}-{version}.{fmt}")
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.directory:
+            try:
+                path = self._path(key)
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # recently used, pruned last
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def accepts(self, size):
+        """Whether a document of ``size`` bytes is worth caching."""
+        return size <= self.max_entry_bytes
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.directory:
+            # Write-then-rename so other workers never read a partial file
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._path(key))
+            except OSError as e:
+                print(f"Export cache write error: {e}")
+                return
+            self._wrote(len(data))
+
+    def _wrote(self, size):
+        with self._lock:
+            self._written += size
+            if self._written < self.dir_max_bytes * PRUNE_EVERY_FRACTION:
+                return
+            self._written = 0
+        prune_directory(self.directory, self.dir_max_bytes)
+
+    def _remember(self, key, data):
+        if not self.accepts(len(data)):
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def invalidate(self, award_id):
+        """Drop every cached export of one award (all versions and formats)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == award_id]:
+                self._bytes -= len(self._entries.pop(key))
+        if self.directory:
+            prefix = f"{award_id}-"
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+            for name in names:
+                if name.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "dir_max_bytes": self.dir_max_bytes if self.directory else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+export_cache = ExportCache()
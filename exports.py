@@ -0,0 +1,374 @@
+"""Single-award PDF and Excel renderers.
+
+These are the only users of reportlab and openpyxl in the web app. Both
+libraries are slow to import and large, so app.py imports this module on
+the first download instead of at startup (or before fork with
+EXPORT_PRELOAD=1, so forked workers share the pages).
+"""
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from budget_calc import award_budget
+
+BUDGET_SUMMARY_HEADERS = ["Year", "Personnel (hours)", "Equipment", "Travel", "Materials", "Total"]
+
+
+def budget_summary_rows(award, lists):
+    """Year x category rows plus a Total row for the export summary tables."""
+    budget = award_budget(award, lists)
+    rows = [[year or "N/A", hours, *amounts, total] for year, hours, amounts, total in budget.rows()]
+    totals = list(budget.by_category.values())
+    rows.append(["Total", budget.total_hours, *totals, budget.total])
+    return rows
+
+
+def write_award_pdf(out, award, personnel, domestic_travel, international_travel, materials):
+    """Write the award PDF (summary + budget tables) to the file object ``out``."""
+    # -------- helpers ----------
+    def hours_text(hours_list):
+        if not hours_list:
+            return ""
+        parts = []
+        for h in hours_list:
+            year = h.get("year")
+            hrs = h.get("hours")
+            if year and hrs not in (None, ""):
+                parts.append(f"{year}: {hrs} hrs")
+        return ", ".join(parts)
+
+    def travel_row(travel_type, t):
+        return [
+            travel_type,
+            t.get("year"),
+            t.get("travel_name") or t.get("name") or "",
+            t.get("description") or "",
+            t.get("start_date") or t.get("depart") or "",
+            t.get("end_date") or t.get("arrive") or "",
+            t.get("flight_cost") or t.get("flight") or "",
+            t.get("taxi_per_day") or "",
+            t.get("food_lodge_per_day") or t.get("food_per_day") or "",
+            t.get("days") or t.get("num_days") or "",
+        ]
+
+    # -------- basic fields ----------
+    title = award.get("title") or "Grant"
+    funding = award.get("sponsor_type") or "N/A"
+    amount = float(award.get("amount") or 0)
+    dept = award.get("department") or "N/A"
+    college = award.get("college") or "N/A"
+    email = award.get("contact_email") or award.get("created_by_email") or "N/A"
+    status = award.get("status") or "Pending"
+    start = award.get("start_date")
+    end = award.get("end_date")
+    abstract = award.get("abstract") or "N/A"
+    keywords = award.get("keywords") or "N/A"
+    collaborators = award.get("collaborators") or "N/A"
+
+    if start and end:
+        period_str = f"{start} \u2192 {end}"
+    else:
+        period_str = "N/A"
+
+    # -------- build the PDF with tables ----------
+    doc = SimpleDocTemplate(
+        out,
+        pagesize=letter,
+        leftMargin=36,
+        rightMargin=36,
+        topMargin=36,
+        bottomMargin=36,
+    )
+    styles = getSampleStyleSheet()
+    normal = styles["Normal"]
+    title_style = styles["Title"]
+
+    elements = []
+
+    # Top title
+    elements.append(Paragraph(title, title_style))
+    elements.append(Spacer(1, 8))
+
+    # Summary block – similar to the top of the HTML view
+    summary_lines = [
+        f"<b>Funding Agency:</b> {funding}",
+        f"<b>Amount:</b> ${amount:,.2f}",
+        f"<b>Period:</b> {period_str}",
+        f"<b>Status:</b> {status}",
+        f"<b>Department:</b> {dept}",
+        f"<b>College:</b> {college}",
+        f"<b>Contact Email:</b> {email}",
+    ]
+    for line in summary_lines:
+        elements.append(Paragraph(line, normal))
+    elements.append(Spacer(1, 10))
+
+    # Abstract / keywords / collaborators
+    elements.append(Paragraph("<b>Abstract:</b>", normal))
+    elements.append(Paragraph(abstract, normal))
+    elements.append(Spacer(1, 6))
+    elements.append(Paragraph(f"<b>Keywords:</b> {keywords}", normal))
+    elements.append(Paragraph(f"<b>Collaborators:</b> {collaborators}", normal))
+    elements.append(Spacer(1, 12))
+
+    # -------- Budget summary (year x category) ----------
+    if personnel or domestic_travel or international_travel or materials:
+        elements.append(Paragraph("Budget Summary", styles["Heading3"]))
+        data = [BUDGET_SUMMARY_HEADERS]
+        for row in budget_summary_rows(
+            award, (personnel, domestic_travel, international_travel, materials)
+        ):
+            data.append([row[0], f"{row[1]:,.2f}"] + [f"${v:,.2f}" for v in row[2:]])
+
+        t = Table(data, repeatRows=1)
+        t.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E0E0E0")),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ]))
+        elements.append(t)
+        elements.append(Spacer(1, 12))
+
+    # -------- Personnel table ----------
+    if personnel:
+        elements.append(Paragraph("Personnel", styles["Heading3"]))
+        data = [["Name", "Position", "Hours for year(s)", "Same Each Year?"]]
+        for p in personnel:
+            data.append([
+                p.get("name") or "",
+                p.get("position") or "",
+                hours_text(p.get("hours")),
+                "Yes" if p.get("same_each_year") else "No",
+            ])
+
+        t = Table(data, repeatRows=1)
+        t.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E0E0E0")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ]))
+        elements.append(t)
+        elements.append(Spacer(1, 12))
+
+    # -------- Travel table (domestic + international) ----------
+    if domestic_travel or international_travel:
+        elements.append(Paragraph("Travel Information", styles["Heading3"]))
+        data = [
+            [
+                "Type", "Year", "Name", "Description",
+                "Departure", "Arrival", "Flight Cost",
+                "Taxi/Day", "Food & Lodge/Day", "Days",
+            ]
+        ]
+        for t_dom in domestic_travel:
+            data.append(travel_row("Domestic", t_dom))
+        for t_int in international_travel:
+            data.append(travel_row("International", t_int))
+
+        t = Table(data, repeatRows=1)
+        t.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E0E0E0")),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ]))
+        elements.append(t)
+        elements.append(Spacer(1, 12))
+
+    # -------- Materials table ----------
+    if materials:
+        elements.append(Paragraph("Materials and Supplies", styles["Heading3"]))
+        data = [["Category", "Year", "Description", "Cost"]]
+        for m in materials:
+            data.append([
+                m.get("material_type") or m.get("category") or "",
+                m.get("year") or "",
+                m.get("description") or "",
+                m.get("cost") or "",
+            ])
+
+        t = Table(data, repeatRows=1)
+        t.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E0E0E0")),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ]))
+        elements.append(t)
+
+    # Build PDF
+    doc.build(elements)
+
+
+# Column widths for the single-award workbook (A..J)
+EXCEL_COLUMN_WIDTHS = [20, 40, 20, 20, 18, 18, 12, 12, 16, 10]
+
+
+def excel_named_styles():
+    """Shared named styles; each workbook registers them once instead of
+    attaching fresh Font/Border objects to every cell."""
+    thin = Side(style="thin", color="000000")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    return [
+        NamedStyle(name="gg_label", font=Font(bold=True)),
+        NamedStyle(
+            name="gg_header",
+            font=Font(bold=True),
+            fill=PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid"),
+            alignment=Alignment(horizontal="center"),
+            border=border,
+        ),
+        NamedStyle(name="gg_cell", border=border),
+    ]
+
+
+def write_award_excel(out, award, personnel, domestic_travel, international_travel, materials):
+    """
+    Write the award budget workbook to the file object ``out``.
+
+    Uses a write-only worksheet: rows are serialized as they are appended
+    rather than kept as a grid of cell objects.
+    """
+    wb = Workbook(write_only=True)
+    for style in excel_named_styles():
+        wb.add_named_style(style)
+    ws = wb.create_sheet("Grant Budget")
+
+    # Set some decent column widths (must happen before the first row)
+    for idx, width in enumerate(EXCEL_COLUMN_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    def write_kv(label, value):
+        ws.append([styled(label, "gg_label"), value])
+
+    def write_table(title, headers, rows):
+        ws.append([styled(title, "gg_label")])
+        ws.append([styled(h, "gg_header") for h in headers])
+        for cols in rows:
+            ws.append([styled(v, "gg_cell") for v in cols])
+
+    def hours_text(hours_list):
+        if not hours_list:
+            return ""
+        parts = []
+        for h in hours_list:
+            year = h.get("year")
+            hrs = h.get("hours")
+            if year and hrs not in (None, ""):
+                parts.append(f"{year}: {hrs} hrs")
+        return ", ".join(parts)
+
+    def travel_cols(travel_type, t):
+        return [
+            travel_type,
+            t.get("year"),
+            t.get("travel_name") or t.get("name") or "",
+            t.get("description") or "",
+            t.get("start_date") or t.get("depart") or "",
+            t.get("end_date") or t.get("arrive") or "",
+            t.get("flight_cost") or t.get("flight") or "",
+            t.get("taxi_per_day") or "",
+            t.get("food_lodge_per_day") or t.get("food_per_day") or "",
+            t.get("days") or t.get("num_days") or "",
+        ]
+
+    write_kv("Title", award.get("title") or "")
+    write_kv("Funding Agency", award.get("sponsor_type") or "")
+    write_kv("Amount", float(award.get("amount") or 0))
+    write_kv("Department", award.get("department") or "")
+    write_kv("College", award.get("college") or "")
+    write_kv("Contact Email", award.get("contact_email") or award.get("created_by_email") or "")
+    write_kv("Start Date", award.get("start_date"))
+    write_kv("End Date", award.get("end_date"))
+    write_kv("Status", award.get("status") or "")
+    ws.append([])
+    write_kv("Abstract", award.get("abstract") or "")
+    write_kv("Keywords", award.get("keywords") or "")
+    write_kv("Collaborators", award.get("collaborators") or "")
+    ws.append([])
+    ws.append([])
+
+    # Budget summary (year x category)
+    if personnel or domestic_travel or international_travel or materials:
+        write_table(
+            "Budget Summary",
+            BUDGET_SUMMARY_HEADERS,
+            (
+                [row[0]] + [round(v, 2) for v in row[1:]]
+                for row in budget_summary_rows(
+                    award, (personnel, domestic_travel, international_travel, materials)
+                )
+            ),
+        )
+        ws.append([])
+        ws.append([])
+
+    # Personnel section
+    if personnel:
+        write_table(
+            "Personnel",
+            ["Name", "Position", "Hours by Year", "Same Each Year?"],
+            (
+                [
+                    p.get("name") or "",
+                    p.get("position") or "",
+                    hours_text(p.get("hours")),
+                    "Yes" if p.get("same_each_year") else "No",
+                ]
+                for p in personnel
+            ),
+        )
+        ws.append([])
+        ws.append([])
+
+    # Travel section (domestic + international)
+    if domestic_travel or international_travel:
+        write_table(
+            "Travel",
+            [
+                "Type", "Year", "Name", "Description",
+                "Departure", "Arrival", "Flight Cost",
+                "Taxi/Day", "Food & Lodge/Day", "Days"
+            ],
+            [travel_cols("Domestic", t) for t in domestic_travel]
+            + [travel_cols("International", t) for t in international_travel],
+        )
+        ws.append([])
+        ws.append([])
+
+    # Materials section
+    if materials:
+        write_table(
+            "Materials and Supplies",
+            ["Category", "Year", "Description", "Cost"],
+            (
+                [
+                    m.get("material_type") or m.get("category") or "",
+                    m.get("year"),
+                    m.get("description") or "",
+                    m.get("cost") or "",
+                ]
+                for m in materials
+            ),
+        )
+
+    wb.save(out)
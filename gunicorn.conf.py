@@ -0,0 +1,19 @@
+"""gunicorn settings (picked up from the working directory).
+
+Pending schema migrations are applied once, in the master before any
+worker forks; the workers then only import the app (see DB_AUTO_MIGRATE).
+"""
+
+
+def on_starting(server):
+    from db import connect
+    from migrate import migrate
+
+    # A plain connection, closed before forking: no pool in the master
+    conn = connect()
+    try:
+        done = migrate(conn)
+    finally:
+        conn.close()
+    if done:
+        server.log.info("Applied migrations %s", ", ".join(f"{v:04d}" for v in done))
@@ -0,0 +1,465 @@
+"""Bulk ingestion of expense transactions from the finance system.
+
+    python ingest.py charges.csv [--format csv|jsonl] [--strict]
+
+Rows are read and validated one at a time and streamed straight into
+``COPY`` (nothing holds the whole file), land in a temp staging table, and
+are merged into ``transactions`` with set-based statements: rows whose
+``external_id`` is already known update that transaction, the rest are
+inserted. Approved spend changes roll into ``budget_lines`` and the
+portfolio summaries in the same database transaction (see budget_lines.py),
+and the awards touched are
+queued for split-purchase detection (see split_purchases.py).
+Rows that fail validation, reference an unknown award/user, or repeat an
+external_id within the file are skipped and reported with their line
+number; with ``strict`` any error rolls the whole batch back.
+
+Fields (CSV header or JSONL keys): award_id, category, amount,
+date_submitted (YYYY-MM-DD) are required; description, status, user_id or
+user_email, and external_id are optional.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from budget_lines import apply_spend_deltas, create_delta_table
+from split_purchases import queue_scan
+
+INGEST_MAX_ERRORS = int(os.getenv("INGEST_MAX_ERRORS", "1000"))
+# Bytes handed to COPY per read() call
+COPY_CHUNK_SIZE = 256 * 1024
+
+TRANSACTION_STATUSES = ("Pending", "Approved", "Declined")
+MAX_AMOUNT = Decimal("9999999999.99")    # DECIMAL(12,2)
+
+# Staging columns, in COPY order
+STAGING_COLUMNS = (
+    "line_no", "award_id", "user_id", "user_email", "category",
+    "description", "amount", "date_submitted", "status", "external_id",
+)
+
+
+class IngestError(Exception):
+    """The upload as a whole is unusable (bad format, missing columns)."""
+
+
+class RowError(ValueError):
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+
+class IngestReport:
+    """Counts plus the first INGEST_MAX_ERRORS per-row errors."""
+
+    def __init__(self, max_errors=INGEST_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.received = 0
+        self.staged = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def error(self, line, field, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "field": field, "error": message})
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "errors_truncated": self.rejected > len(self.errors),
+        }
+
+
+# ---- parsing ----
+
+def _text(value, field, max_len, required=False):
+    value = "" if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise RowError(field, "is required")
+        return None
+    if len(value) > max_len:
+        raise RowError(field, f"longer than {max_len} characters")
+    return value
+
+
+def _positive_int(value, field, required=False):
+    if value in (None, ""):
+        if required:
+            raise RowError(field, "is required")
+        return None
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise RowError(field, f"not an integer: {value!r}") from None
+    if number <= 0:
+        raise RowError(field, "must be positive")
+    return number
+
+
+def _amount(value):
+    if value in (None, ""):
+        raise RowError("amount", "is required")
+    try:
+        amount = Decimal(str(value).strip().replace(",", "").lstrip("$"))
+    except InvalidOperation:
+        raise RowError("amount", f"not a number: {value!r}") from None
+    if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+        raise RowError("amount", "out of range")
+    return amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def _date(value):
+    if value in (None, ""):
+        raise RowError("date_submitted", "is required")
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise RowError("date_submitted", f"not a YYYY-MM-DD date: {value!r}") from None
+
+
+def validate_row(raw):
+    """Raw dict -> tuple of staging values (minus line_no); raises RowError."""
+    status = _text(raw.get("status"), "status", 20)
+    if status is not None:
+        status = status.capitalize()
+        if status not in TRANSACTION_STATUSES:
+            raise RowError("status", f"must be one of {', '.join(TRANSACTION_STATUSES)}")
+    user_email = _text(raw.get("user_email"), "user_email", 255)
+    return (
+        _positive_int(raw.get("award_id"), "award_id", required=True),
+        _positive_int(raw.get("user_id"), "user_id"),
+        user_email.lower() if user_email else None,
+        _text(raw.get("category"), "category", 100, required=True),
+        _text(raw.get("description"), "description", 10000),
+        _amount(raw.get("amount")),
+        _date(raw.get("date_submitted") or raw.get("date")),
+        status,
+        _text(raw.get("external_id"), "external_id", 100),
+    )
+
+
+def read_csv(text_stream):
+    """
+    Check the CSV header row, then return an iterator of (line_no, row dict).
+    Raises IngestError up front if required columns are missing.
+    """
+    reader = csv.DictReader(text_stream)
+    if reader.fieldnames is None:
+        return iter(())
+    reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames]
+    missing = {"award_id", "category", "amount"} - set(reader.fieldnames)
+    if missing or not {"date_submitted", "date"} & set(reader.fieldnames):
+        raise IngestError(
+            "CSV header must include award_id, category, amount and date_submitted"
+        )
+    return ((reader.line_num, row) for row in reader)
+
+
+def read_jsonl(text_stream):
+    """Yield (line_no, row dict) from a JSON-lines stream."""
+    for line_no, line in enumerate(text_stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, RowError("line", f"invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_no, RowError("line", "expected a JSON object")
+            continue
+        yield line_no, row
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+# ---- COPY ----
+
+_COPY_SPECIAL_RE = re.compile(r"[\\\t\n\r]")
+_COPY_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+
+
+def _copy_line(values):
+    """One COPY text-format line; only strings can need escaping."""
+    out = []
+    for value in values:
+        if value is None:
+            out.append("\\N")
+        elif isinstance(value, str):
+            if _COPY_SPECIAL_RE.search(value):
+                value = _COPY_SPECIAL_RE.sub(lambda m: _COPY_ESCAPES[m.group()], value)
+            out.append(value)
+        else:
+            out.append(str(value))
+    return "\t".join(out) + "\n"
+
+
+class _CopySource:
+    """File-like object that validates rows lazily as COPY reads it."""
+
+    def __init__(self, rows, report):
+        self._rows = rows
+        self._report = report
+        self._buffer = ""
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else COPY_CHUNK_SIZE
+        parts = [self._buffer]
+        length = len(self._buffer)
+        for line_no, raw in self._rows:
+            self._report.received += 1
+            try:
+                if isinstance(raw, RowError):
+                    raise raw
+                values = (line_no, *validate_row(raw))
+            except RowError as e:
+                self._report.error(line_no, e.field, str(e))
+            else:
+                self._report.staged += 1
+                line = _copy_line(values)
+                parts.append(line)
+                length += len(line)
+            if length >= size:
+                break
+        data = "".join(parts)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _merge(cur, report):
+    """Reject staged rows the database can't accept, then upsert the rest."""
+    # Resolve user_email to user_id
+    cur.execute(
+        """
+        UPDATE ingest_staging s SET user_id = u.user_id
+        FROM users u
+        WHERE s.user_id IS NULL AND s.user_email IS NOT NULL
+          AND lower(u.email) = s.user_email
+        """
+    )
+    cur.execute(
+        """
+        UPDATE ingest_staging s SET error_field = 'award_id', error = 'unknown award'
+        WHERE NOT EXISTS (SELECT 1 FROM awards a WHERE a.award_id = s.award_id)
+        """
+    )
+    cur.execute(
+        """
+        UPDATE ingest_staging s SET error_field = 'user', error = 'unknown user'
+        WHERE error IS NULL AND (
+            (s.user_id IS NULL AND s.user_email IS NOT NULL)
+            OR (s.user_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM users u WHERE u.user_id = s.user_id))
+        )
+        """
+    )
+    # The last occurrence of an external_id in the file wins
+    cur.execute(
+        """
+        UPDATE ingest_staging s
+        SET error_field = 'external_id',
+            error = 'duplicate external_id, superseded by line ' || d.last_line
+        FROM (
+            SELECT external_id, max(line_no) AS last_line
+            FROM ingest_staging
+            WHERE external_id IS NOT NULL AND error IS NULL
+            GROUP BY external_id HAVING count(*) > 1
+        ) d
+        WHERE s.external_id = d.external_id AND s.line_no < d.last_line
+          AND s.error IS NULL
+        """
+    )
+    cur.execute(
+        """
+        SELECT line_no, error_field, error FROM ingest_staging
+        WHERE error IS NOT NULL ORDER BY line_no
+        """
+    )
+    for line_no, field, message in cur:
+        report.error(line_no, field, message)
+
+    # Both statements record what they change to Approved spend in
+    # spend_deltas; budget_lines picks that up before commit
+    create_delta_table(cur)
+    cur.execute(
+        """
+        WITH changed AS (
+            UPDATE transactions t
+            SET award_id = s.award_id,
+                user_id = COALESCE(s.user_id, t.user_id),
+                category = s.category,
+                description = COALESCE(s.description, t.description),
+                amount = s.amount,
+                date_submitted = s.date_submitted,
+                status = COALESCE(s.status, t.status)
+            FROM ingest_staging s
+            JOIN transactions old ON old.external_id = s.external_id
+            WHERE s.error IS NULL AND t.transaction_id = old.transaction_id
+            RETURNING old.award_id AS old_award_id, old.category AS old_category,
+                      old.amount AS old_amount, old.status AS old_status,
+                      old.date_submitted AS old_date_submitted,
+                      t.award_id, t.category, t.amount, t.status, t.date_submitted
+        ), deltas AS (
+            INSERT INTO spend_deltas (award_id, category, delta, spent_on)
+            SELECT award_id, category, amount, date_submitted FROM changed
+            WHERE status = 'Approved'
+            UNION ALL
+            SELECT old_award_id, old_category, -old_amount, old_date_submitted FROM changed
+            WHERE old_status = 'Approved'
+        ), moved AS (
+            INSERT INTO split_purchase_pending (award_id)
+            SELECT DISTINCT old_award_id FROM changed WHERE old_award_id <> award_id
+            ON CONFLICT DO NOTHING
+        )
+        SELECT COUNT(*) FROM changed
+        """
+    )
+    report.updated = cur.fetchone()[0]
+    cur.execute(
+        """
+        WITH added AS (
+            INSERT INTO transactions
+                (award_id, user_id, category, description, amount,
+                 date_submitted, status, external_id)
+            SELECT award_id, user_id, category, description, amount,
+                   date_submitted, COALESCE(status, 'Pending'), external_id
+            FROM ingest_staging s
+            WHERE error IS NULL
+              AND (external_id IS NULL OR NOT EXISTS (
+                  SELECT 1 FROM transactions t WHERE t.external_id = s.external_id))
+            ORDER BY line_no
+            ON CONFLICT (external_id) WHERE external_id IS NOT NULL DO NOTHING
+            RETURNING award_id, category, amount, status, date_submitted
+        ), deltas AS (
+            INSERT INTO spend_deltas (award_id, category, delta, spent_on)
+            SELECT award_id, category, amount, date_submitted FROM added
+            WHERE status = 'Approved'
+        )
+        SELECT COUNT(*) FROM added
+        """
+    )
+    report.inserted = cur.fetchone()[0]
+    apply_spend_deltas(cur)
+
+    if report.inserted or report.updated:
+        cur.execute(
+            """
+            INSERT INTO split_purchase_pending (award_id)
+            SELECT DISTINCT award_id FROM ingest_staging WHERE error IS NULL
+            ON CONFLICT DO NOTHING
+            """
+        )
+        queue_scan(cur)
+
+
+def ingest(conn, stream, fmt="csv", strict=False, report=None):
+    """
+    Load a CSV/JSONL byte or text stream into transactions and commit.
+    Returns the IngestReport; with ``strict`` nothing is written if any
+    row was rejected. Raises IngestError for unusable uploads.
+    """
+    if fmt not in READERS:
+        raise IngestError(f"unsupported format {fmt!r} (use csv or jsonl)")
+    if isinstance(stream, io.TextIOBase):
+        text_stream = stream
+    else:
+        # utf-8-sig drops the BOM spreadsheet exports like to add
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    report = report or IngestReport()
+
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            CREATE TEMP TABLE ingest_staging (
+                line_no INTEGER PRIMARY KEY,
+                award_id INTEGER,
+                user_id INTEGER,
+                user_email TEXT,
+                category VARCHAR(100),
+                description TEXT,
+                amount DECIMAL(12,2),
+                date_submitted DATE,
+                status VARCHAR(20),
+                external_id VARCHAR(100),
+                error_field TEXT,
+                error TEXT
+            ) ON COMMIT DROP
+            """
+        )
+        rows = READERS[fmt](text_stream)
+        source = _CopySource(rows, report)
+        cur.copy_expert(
+            f"COPY ingest_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN",
+            source, size=COPY_CHUNK_SIZE,
+        )
+        cur.execute("ANALYZE ingest_staging")
+        _merge(cur, report)
+        report.errors.sort(key=lambda e: e["line"])
+
+        if strict and report.rejected:
+            conn.rollback()
+            report.inserted = report.updated = 0
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return report
+
+
+def format_for(filename=None, content_type=None, default="csv"):
+    """Guess csv/jsonl from a file name or Content-Type."""
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in ctype or "jsonl" in ctype:
+        return "jsonl"
+    if name.endswith(".csv") or "csv" in ctype:
+        return "csv"
+    return default
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import expense transactions")
+    parser.add_argument("file", help="CSV or JSONL file ('-' for stdin)")
+    parser.add_argument("--format", choices=sorted(READERS), default=None)
+    parser.add_argument("--strict", action="store_true",
+                        help="import nothing if any row is rejected")
+    args = parser.parse_args(argv)
+
+    from db import db_connection
+
+    fmt = args.format or format_for(args.file)
+    with db_connection() as conn:
+        if args.file == "-":
+            report = ingest(conn, sys.stdin.buffer, fmt, args.strict)
+        else:
+            with open(args.file, "rb") as f:
+                report = ingest(conn, f, fmt, args.strict)
+
+    result = report.as_dict()
+    for e in result["errors"]:
+        print(f"line {e['line']}: {e['field']}: {e['error']}", file=sys.stderr)
+    print(json.dumps({k: v for k, v in result.items() if k != "errors"}))
+    return 1 if report.rejected and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
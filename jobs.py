@@ -0,0 +1,332 @@
+"""Postgres-backed background job queue.
+
+Jobs live in the ``jobs`` table. Workers (see worker.py) claim them with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of worker processes can
+poll the same table without handing one job to two of them. Failed jobs are
+retried with exponential backoff until ``max_attempts``; jobs whose worker
+died mid-run are re-queued once their heartbeat goes stale (or failed,
+when that was their last attempt). One background thread per worker
+process beats for every job the process runs, on a connection of its own,
+so long handlers that never report progress are not mistaken for orphans.
+A worker only finishes or fails a job it still holds.
+
+Handlers are registered with ``@job_handler("type")`` and called as
+``handler(ctx, payload)``; whatever they return is stored as the job result.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from db import connect, db_connection
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "10"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "3600"))
+# A running job with no heartbeat for this long is assumed orphaned
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# How often a running job's heartbeat is refreshed (well inside the above)
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_STALE_SECONDS / 4)))
+
+_handlers = {}
+
+
+def job_handler(job_type):
+    """Register ``fn(ctx, payload) -> result`` as the handler for job_type."""
+    def register(fn):
+        _handlers[job_type] = fn
+        return fn
+    return register
+
+
+def enqueue(cur, job_type, payload=None, created_by_email=None, max_attempts=5, delay=0):
+    """
+    Queue a job inside the caller's transaction and return its job_id.
+    ``delay`` (seconds) holds it back, e.g. to let more work pile up first.
+    """
+    cur.execute(
+        """
+        INSERT INTO jobs (job_type, payload, created_by_email, max_attempts, run_after)
+        VALUES (%s, %s::jsonb, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+        RETURNING job_id
+        """,
+        (job_type, json.dumps(payload or {}), created_by_email, max_attempts, delay),
+    )
+    return cur.fetchone()[0]
+
+
+def backoff_seconds(attempts):
+    """Delay before retry number ``attempts`` (1-based): base * 2^(n-1), capped."""
+    return min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+
+
+class JobContext:
+    """Handed to handlers so they can report progress (also the heartbeat)."""
+
+    # Don't write progress more often than this
+    MIN_UPDATE_INTERVAL = 1.0
+
+    def __init__(self, job_id, attempts):
+        self.job_id = job_id
+        self.attempts = attempts
+        self._last_update = 0.0
+
+    def progress(self, done, total=None, note=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_update < self.MIN_UPDATE_INTERVAL:
+            return
+        self._last_update = now
+        fraction = min(1.0, done / total) if total else None
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE jobs
+                SET progress = COALESCE(%s, progress),
+                    progress_note = COALESCE(%s, progress_note),
+                    heartbeat_at = CURRENT_TIMESTAMP
+                WHERE job_id = %s
+                """,
+                (fraction, note, self.job_id),
+            )
+            conn.commit()
+            cur.close()
+
+
+class _Heartbeat:
+    """
+    Refreshes heartbeat_at of every job this process is running, from one
+    background thread on a dedicated connection -- outside the pool, so
+    busy job threads can never starve it.
+    """
+
+    def __init__(self, interval=JOB_HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self._jobs = {}                 # job_id -> worker_id that claimed it
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+
+    @contextmanager
+    def running(self, job_id, worker_id):
+        """Beat for job_id (claimed by worker_id) while the block runs."""
+        with self._lock:
+            self._jobs[job_id] = worker_id
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="job-heartbeat",
+                                                daemon=True)
+                self._thread.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                jobs = sorted(self._jobs.items())
+            if not jobs:
+                continue
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = connect()
+                cur = self._conn.cursor()
+                cur.execute(
+                    """
+                    UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE status = 'running'
+                      AND (job_id, locked_by) IN (
+                          SELECT * FROM unnest(%s::int[], %s::varchar[]))
+                    """,
+                    ([job_id for job_id, _ in jobs], [worker for _, worker in jobs]),
+                )
+                self._conn.commit()
+                cur.close()
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+
+
+_heartbeat = _Heartbeat()
+
+
+def claim_job(conn, worker_id, job_types=None):
+    """Atomically take the next runnable job, or return None."""
+    cur = conn.cursor()
+    type_filter = "AND job_type = ANY(%s)" if job_types else ""
+    params = [worker_id]
+    if job_types:
+        params.append(list(job_types))
+    cur.execute(
+        f"""
+        UPDATE jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            started_at = CURRENT_TIMESTAMP,
+            heartbeat_at = CURRENT_TIMESTAMP,
+            locked_by = %s
+        WHERE job_id = (
+            SELECT job_id FROM jobs
+            WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+              {type_filter}
+            ORDER BY run_after, job_id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING job_id, job_type, payload, attempts, max_attempts
+        """,
+        params,
+    )
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return row
+
+
+def finish_job(conn, job_id, worker_id, result):
+    """
+    Mark the job done, unless worker_id no longer holds it (it went stale
+    and was re-queued). Returns whether it did.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE jobs
+        SET status = 'done', progress = 1, result = %s::jsonb,
+            last_error = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE job_id = %s AND status = 'running' AND locked_by = %s
+        """,
+        (json.dumps(result, default=str), job_id, worker_id),
+    )
+    held = cur.rowcount == 1
+    conn.commit()
+    cur.close()
+    return held
+
+
+def fail_job(conn, job_id, worker_id, attempts, max_attempts, error):
+    """
+    Re-queue with backoff, or mark failed once attempts are used up;
+    nothing if worker_id no longer holds the job. Returns whether it did.
+    """
+    cur = conn.cursor()
+    if attempts < max_attempts:
+        cur.execute(
+            """
+            UPDATE jobs
+            SET status = 'queued', last_error = %s,
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE job_id = %s AND status = 'running' AND locked_by = %s
+            """,
+            (error, backoff_seconds(attempts), job_id, worker_id),
+        )
+    else:
+        cur.execute(
+            """
+            UPDATE jobs
+            SET status = 'failed', last_error = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE job_id = %s AND status = 'running' AND locked_by = %s
+            """,
+            (error, job_id, worker_id),
+        )
+    held = cur.rowcount == 1
+    conn.commit()
+    cur.close()
+    return held
+
+
+def requeue_stale_jobs(conn):
+    """
+    Put jobs whose worker stopped heartbeating back in the queue, or mark
+    them failed when that was their last attempt (a job that keeps killing
+    its worker is not retried forever).
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+            finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+            last_error = 'worker lost (stale heartbeat)'
+        WHERE status = 'running'
+          AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """,
+        (JOB_STALE_SECONDS,),
+    )
+    count = cur.rowcount
+    conn.commit()
+    cur.close()
+    return count
+
+
+def run_one(worker_id, job_types=None):
+    """Claim and run a single job. Returns True if a job was processed."""
+    with db_connection() as conn:
+        job = claim_job(conn, worker_id, job_types)
+    if job is None:
+        return False
+
+    job_id, job_type, payload, attempts, max_attempts = job
+    handler = _handlers.get(job_type)
+    try:
+        if handler is None:
+            raise LookupError(f"no handler registered for job type {job_type!r}")
+        with _heartbeat.running(job_id, worker_id):
+            result = handler(JobContext(job_id, attempts), payload or {})
+    except Exception as e:
+        print(f"Job {job_id} ({job_type}) attempt {attempts} failed: {e}")
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        with db_connection() as conn:
+            held = fail_job(conn, job_id, worker_id, attempts, max_attempts, error)
+    else:
+        with db_connection() as conn:
+            held = finish_job(conn, job_id, worker_id, result)
+    if not held:
+        print(f"Job {job_id} ({job_type}) was re-queued while {worker_id} ran it; "
+              f"outcome discarded")
+    return True
+
+
+def run_worker(concurrency=1, job_types=None, stop_event=None):
+    """Run ``concurrency`` polling threads until stop_event is set."""
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop(n):
+        name = f"{worker_id}/{n}"
+        last_sweep = 0.0
+        while not stop_event.is_set():
+            try:
+                if n == 0 and time.monotonic() - last_sweep > JOB_STALE_SECONDS / 4:
+                    last_sweep = time.monotonic()
+                    with db_connection() as conn:
+                        requeue_stale_jobs(conn)
+                if not run_one(name, job_types):
+                    stop_event.wait(JOB_POLL_INTERVAL)
+            except Exception as e:
+                print(f"Worker {name} error: {e}")
+                stop_event.wait(JOB_POLL_INTERVAL)
+
+    threads = [
+        threading.Thread(target=loop, args=(n,), name=f"job-worker-{n}", daemon=True)
+        for n in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for t in threads:
+            t.join()
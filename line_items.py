@@ -0,0 +1,78 @@
+"""An award's budget line items as the JSON lists the app works with.
+
+The detail tables -- personnel_expenses (+ personnel_hours per year),
+travel_expenses and material_supplies -- are the only store of an award's
+budget (see migrations/0013_line_item_store.sql). ``json_columns`` reads
+them back as personnel_json, domestic_travel_json,
+international_travel_json and materials_json, in the shape grant_form.js
+posts: one jsonb_agg per list, correlated on award_id, so a single
+statement returns awards with their budgets and can be used wherever
+``SELECT * FROM awards`` used to carry the blobs.
+"""
+
+_PERSONNEL = """
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+               'id', p.line_item_id,
+               'name', p.person_name,
+               'position', COALESCE(p.position_title, ''),
+               'same_each_year', COALESCE(p.same_each_year, FALSE),
+               'hours', COALESCE((
+                   SELECT jsonb_agg(jsonb_build_object('year', h.year, 'hours', h.hours)
+                                    ORDER BY h.year NULLS FIRST, h.hours_id)
+                   FROM personnel_hours h
+                   WHERE h.personnel_id = p.personnel_id
+               ), '[]')
+           ) ORDER BY p.personnel_id), '[]')
+    FROM personnel_expenses p
+    WHERE p.award_id = {awards}.award_id
+"""
+
+_TRAVEL = """
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+               'id', t.line_item_id,
+               'name', COALESCE(t.travel_name, ''),
+               'description', COALESCE(t.description, ''),
+               'year', t.year,
+               'depart', t.start_date,
+               'arrive', t.end_date,
+               'flight', t.flight_cost,
+               'taxi_per_day', t.taxi_per_day,
+               'food_per_day', t.food_lodge_per_day,
+               'days', t.num_days
+           ) ORDER BY t.travel_id), '[]')
+    FROM travel_expenses t
+    WHERE t.award_id = {awards}.award_id AND t.travel_type = '{travel_type}'
+"""
+
+_MATERIALS = """
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+               'id', m.line_item_id,
+               'category', COALESCE(m.material_type, ''),
+               'cost', m.cost,
+               'description', COALESCE(m.description, ''),
+               'year', m.year
+           ) ORDER BY m.material_id), '[]')
+    FROM material_supplies m
+    WHERE m.award_id = {awards}.award_id
+"""
+
+# (column, subquery) in the order of app.BUDGET_JSON_COLUMNS
+LINE_ITEM_QUERIES = (
+    ("personnel_json", _PERSONNEL),
+    ("domestic_travel_json", _TRAVEL.replace("{travel_type}", "Domestic")),
+    ("international_travel_json", _TRAVEL.replace("{travel_type}", "International")),
+    ("materials_json", _MATERIALS),
+)
+
+
+def json_expressions(awards="awards"):
+    """The four list subqueries for the awards table (or alias) ``awards``."""
+    return [f"({sql.format(awards=awards).strip()})" for _, sql in LINE_ITEM_QUERIES]
+
+
+def json_columns(awards="awards"):
+    """SELECT-list entries adding personnel_json ... materials_json to an awards query."""
+    return ",\n".join(
+        f"{expr} AS {column}"
+        for (column, _), expr in zip(LINE_ITEM_QUERIES, json_expressions(awards))
+    )
@@ -0,0 +1,304 @@
+"""Request latency and SQL instrumentation, exposed in Prometheus text format.
+
+Every connection from db.py is an ``InstrumentedConnection``: its cursors
+(whatever ``cursor_factory`` the caller asks for) time each execute /
+executemany / copy, count it per statement type, and add it to the current
+request's tally. ``init_app`` hooks Flask so each request lands in a
+latency histogram keyed by method, route rule and status; with
+METRICS_DEBUG_HEADER=1 responses also carry an ``X-DB-Stats`` header with
+the request's query count and database time, which makes N+1 loops easy
+to spot.
+
+Statements slower than SLOW_QUERY_MS are printed with their literals and
+parameters redacted. Metrics are per process (each gunicorn worker serves
+its own /metrics); scrapers authenticate with ``Authorization: Bearer
+$METRICS_TOKEN``.
+"""
+import os
+import re
+import threading
+import time
+
+import psycopg2.extensions
+from flask import g, has_request_context, request
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Adds X-DB-Stats: queries=<n> db_ms=<ms> total_ms=<ms> to every response
+METRICS_DEBUG_HEADER = os.getenv("METRICS_DEBUG_HEADER", "0") == "1"
+# Longest statement text printed by the slow-query log
+SLOW_QUERY_LOG_CHARS = 2000
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUES_LIST = re.compile(r"(\([^()']*\))(?:, \([^()']*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label tuple (thread-safe)."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}   # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {values[-2]}')
+            lines.append(f"{self.name}_sum{{{base}}} {values[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {values[-2]}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label tuple (thread-safe)."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value}" if base else f"{self.name} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_LATENCY = Histogram(
+    "grantguard_http_request_duration_seconds", "Request latency by route",
+    ("method", "route", "status"), REQUEST_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    "grantguard_db_query_duration_seconds", "SQL statement latency by statement type",
+    ("statement",), QUERY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "grantguard_http_request_queries", "SQL statements issued per request",
+    ("route",), (1, 2, 5, 10, 20, 50, 100, 250, 1000),
+)
+SLOW_QUERIES = Counter(
+    "grantguard_db_slow_queries_total", "Statements slower than SLOW_QUERY_MS",
+    ("statement",),
+)
+QUERY_ERRORS = Counter(
+    "grantguard_db_query_errors_total", "Statements that raised", ("statement",),
+)
+
+_REGISTRY = (REQUEST_LATENCY, REQUEST_QUERIES, QUERY_LATENCY, SLOW_QUERIES, QUERY_ERRORS)
+
+
+# ---------------------------------------------------------------- SQL timing
+
+def _sql_text(sql):
+    if isinstance(sql, bytes):
+        return sql.decode("utf-8", "replace")
+    if isinstance(sql, str):
+        return sql
+    return str(sql)     # psycopg2.sql.Composed needs a connection; good enough here
+
+
+def statement_type(sql):
+    """Leading keyword of a statement (SELECT, INSERT, ...), for labels."""
+    text = _sql_text(sql).lstrip()
+    if text[:4].upper() == "WITH":
+        # Data-modifying CTEs are labelled by the main statement
+        for keyword in ("INSERT", "UPDATE", "DELETE"):
+            if re.search(rf"\)\s*{keyword}\b", text, re.IGNORECASE):
+                return keyword
+        return "SELECT"
+    word = text.split(None, 1)[0].upper() if text else ""
+    return word if word.isalpha() else "OTHER"
+
+
+def redact(sql):
+    """Statement text with literals replaced by ? and whitespace collapsed."""
+    text = _WHITESPACE.sub(" ", _sql_text(sql)).strip()
+    text = _STRING_LITERAL.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    # execute_values inlines every row; keep the first
+    text = _VALUES_LIST.sub(r"\1, ...", text)
+    if len(text) > SLOW_QUERY_LOG_CHARS:
+        text = text[:SLOW_QUERY_LOG_CHARS] + " ..."
+    return text
+
+
+def _param_summary(params):
+    if params is None:
+        return "none"
+    try:
+        n = len(params)
+    except TypeError:
+        return "1 param"
+    return f"{n} params redacted"
+
+
+def record_query(sql, params, seconds, failed=False):
+    """Account one statement: histogram, slow log and the request's tally."""
+    kind = statement_type(sql)
+    QUERY_LATENCY.observe((kind,), seconds)
+    if failed:
+        QUERY_ERRORS.inc((kind,))
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc((kind,))
+        route = request.path if has_request_context() else "-"
+        print(f"Slow query ({seconds * 1000:.0f} ms, {route}, {_param_summary(params)}): {redact(sql)}")
+    if has_request_context():
+        g.sql_count = g.get("sql_count", 0) + 1
+        g.sql_seconds = g.get("sql_seconds", 0.0) + seconds
+
+
+class _TimedCursorMixin:
+    """Times execute / executemany / copy_expert / callproc of a cursor class."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            record_query(query, vars, time.perf_counter() - start, failed)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(query, vars_list)
+            failed = False
+            return result
+        finally:
+            record_query(query, None, time.perf_counter() - start, failed)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().copy_expert(sql, file, size)
+            failed = False
+            return result
+        finally:
+            record_query(sql, None, time.perf_counter() - start, failed)
+
+    def callproc(self, procname, parameters=None):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().callproc(procname, parameters)
+            failed = False
+            return result
+        finally:
+            record_query(f"CALL {procname}", parameters, time.perf_counter() - start, failed)
+
+
+_timed_classes = {}
+_timed_lock = threading.Lock()
+
+
+def timed_cursor_class(cursor_class):
+    """Subclass of ``cursor_class`` with statement timing (cached)."""
+    timed = _timed_classes.get(cursor_class)
+    if timed is None:
+        with _timed_lock:
+            timed = _timed_classes.get(cursor_class)
+            if timed is None:
+                timed = type(f"Timed{cursor_class.__name__}", (_TimedCursorMixin, cursor_class), {})
+                _timed_classes[cursor_class] = timed
+    return timed
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors are timed (see record_query)."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+# ------------------------------------------------------------ request timing
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+
+
+def _observe_request(status):
+    if "request_started" not in g or g.get("request_observed"):
+        return None
+    g.request_observed = True
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_LATENCY.observe((request.method, route, str(status)), elapsed)
+    REQUEST_QUERIES.observe((route,), g.get("sql_count", 0))
+    return elapsed
+
+
+def _after_request(response):
+    elapsed = _observe_request(response.status_code)
+    if METRICS_DEBUG_HEADER and elapsed is not None:
+        response.headers["X-DB-Stats"] = (
+            f"queries={g.get('sql_count', 0)} "
+            f"db_ms={g.get('sql_seconds', 0.0) * 1000:.1f} total_ms={elapsed * 1000:.1f}"
+        )
+    return response
+
+
+def _teardown_request(exc=None):
+    # Requests that raised never reach after_request
+    if exc is not None:
+        _observe_request(500)
+
+
+def init_app(app):
+    """Register the request timing hooks on a Flask app."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
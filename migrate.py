@@ -0,0 +1,147 @@
+"""Versioned schema migrations.
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied / pending migrations
+
+Migrations are the numbered ``migrations/NNNN_name.sql`` files, applied in
+order, each in its own transaction together with its ``schema_version`` row.
+Only one process migrates at a time (a session advisory lock); the others
+wait for it and then find nothing to do. When the database is current a
+boot costs a single ``SELECT max(version)``.
+
+Schema changes go in a new file -- never edit one that has been applied
+(the recorded checksum makes that visible). The early files only use
+IF NOT EXISTS / ON CONFLICT DDL, so databases created from the old
+schema_postgresql.sql adopt them without changes.
+"""
+import argparse
+import hashlib
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+_MIGRATE_LOCK_KEY = 0x4D494752    # "MIGR"
+
+
+def _migrations():
+    """[(version, name, path)] for the migration files, in version order."""
+    found = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        m = _MIGRATION_FILE.match(filename)
+        if m:
+            found.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    found.sort()
+    versions = [v for v, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return found
+
+
+def _checksum(sql):
+    return hashlib.sha1(sql.encode("utf-8")).hexdigest()
+
+
+def current_version(cur):
+    """Highest applied version (0 for a database that has never migrated)."""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def latest_version():
+    found = _migrations()
+    return found[-1][0] if found else 0
+
+
+def migrate(conn):
+    """
+    Apply pending migrations and return the versions applied ([] when the
+    database was already current).
+    """
+    cur = conn.cursor()
+    try:
+        pending_exist = current_version(cur) < latest_version()
+        conn.commit()
+        if not pending_exist:
+            return []
+
+        cur.execute("SELECT pg_advisory_lock(%s)", (_MIGRATE_LOCK_KEY,))
+        try:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    checksum CHAR(40) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            conn.commit()
+            cur.execute("SELECT version, checksum FROM schema_version")
+            applied = dict(cur.fetchall())
+            conn.commit()
+
+            done = []
+            for version, name, path in _migrations():
+                with open(path, "r") as f:
+                    sql = f.read()
+                if version in applied:
+                    if applied[version] != _checksum(sql):
+                        print(f"Warning: migration {version:04d}_{name} changed after it was applied")
+                    continue
+                try:
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_version (version, name, checksum) VALUES (%s, %s, %s)",
+                        (version, name, _checksum(sql)),
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    print(f"Migration {version:04d}_{name} failed")
+                    raise
+                done.append(version)
+                print(f"✓ Applied migration {version:04d}_{name}")
+            return done
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATE_LOCK_KEY,))
+            conn.commit()
+    finally:
+        cur.close()
+
+
+def status(conn):
+    """[(version, name, applied_at or None)] for every migration file."""
+    cur = conn.cursor()
+    applied = {}
+    if current_version(cur):
+        cur.execute("SELECT version, applied_at FROM schema_version")
+        applied = dict(cur.fetchall())
+    cur.close()
+    conn.commit()
+    return [(version, name, applied.get(version)) for version, name, _ in _migrations()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GrantGuard schema migrations")
+    parser.add_argument("--status", action="store_true",
+                        help="list migrations and whether they are applied")
+    args = parser.parse_args(argv)
+
+    from db import db_connection
+
+    with db_connection() as conn:
+        if args.status:
+            for version, name, applied_at in status(conn):
+                print(f"{version:04d}_{name:<32} {applied_at or 'pending'}")
+            return
+        done = migrate(conn)
+    print(f"Applied {len(done)} migrations" if done else "Database schema is current")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+-- ======================
+-- DASHBOARD INDEXES
+-- ======================
+-- Dashboard keyset pagination: every listing is ordered by
+-- (created_at DESC, award_id DESC), optionally narrowed by one filter column.
+CREATE INDEX IF NOT EXISTS awards_created_idx
+    ON awards(created_at DESC, award_id DESC)
+    WHERE status <> 'Draft';
+CREATE INDEX IF NOT EXISTS awards_pi_created_idx
+    ON awards(created_by_email, created_at DESC, award_id DESC);
+CREATE INDEX IF NOT EXISTS awards_status_created_idx
+    ON awards(status, created_at DESC, award_id DESC);
+CREATE INDEX IF NOT EXISTS awards_sponsor_type_created_idx
+    ON awards(sponsor_type, created_at DESC, award_id DESC);
+CREATE INDEX IF NOT EXISTS awards_department_created_idx
+    ON awards(department, created_at DESC, award_id DESC);
+CREATE INDEX IF NOT EXISTS awards_college_created_idx
+    ON awards(college, created_at DESC, award_id DESC);
@@ -0,0 +1,31 @@
+-- ======================
+-- BUDGET POOLS (approved-budget ledger)
+-- ======================
+-- committed_amount is the running total of Approved awards charged to the
+-- pool. It is changed only in the same transaction as the award's status,
+-- with the pool row locked (SELECT ... FOR UPDATE), so concurrent approvals
+-- cannot overspend. college / fiscal_year NULL means "any".
+CREATE TABLE IF NOT EXISTS budget_pools (
+    pool_id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    college VARCHAR(255),
+    fiscal_year INTEGER,
+    initial_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+    committed_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS budget_pools_scope_idx
+    ON budget_pools(COALESCE(college, ''), COALESCE(fiscal_year, 0));
+
+-- Default university-wide pool (was the ADMIN_INITIAL_BUDGET constant).
+-- Seeded once with whatever was already approved before the ledger existed.
+INSERT INTO budget_pools (name, initial_amount, committed_amount)
+SELECT 'University', 1000000,
+       (SELECT COALESCE(SUM(amount), 0) FROM awards WHERE status = 'Approved')
+WHERE NOT EXISTS (SELECT 1 FROM budget_pools WHERE name = 'University');
+
+-- Pool an Approved award was charged to (NULL = default pool)
+ALTER TABLE awards
+  ADD COLUMN IF NOT EXISTS budget_pool_id INTEGER
+    REFERENCES budget_pools(pool_id) ON DELETE SET NULL;
@@ -0,0 +1,23 @@
+-- ======================
+-- LINE-ITEM IDS (incremental budget edits)
+-- ======================
+-- Stable line-item ids (the "id" in the JSON lists, set by grant_form.js) so
+-- edits can update/insert/delete only the rows that changed.
+ALTER TABLE personnel_expenses
+  ADD COLUMN IF NOT EXISTS line_item_id VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS personnel_line_item_idx
+    ON personnel_expenses(award_id, line_item_id);
+
+ALTER TABLE travel_expenses
+  ADD COLUMN IF NOT EXISTS line_item_id VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS travel_line_item_idx
+    ON travel_expenses(award_id, line_item_id);
+
+ALTER TABLE material_supplies
+  ADD COLUMN IF NOT EXISTS line_item_id VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS material_line_item_idx
+    ON material_supplies(award_id, line_item_id);
+
+-- Content hash per JSONB budget column; unchanged blobs are not rewritten
+ALTER TABLE awards
+  ADD COLUMN IF NOT EXISTS budget_json_hash JSONB;
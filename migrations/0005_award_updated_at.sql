@@ -0,0 +1,6 @@
+-- ======================
+-- AWARD LAST-MODIFIED (exports)
+-- ======================
+-- Last change to the award (edit or status); drives export Last-Modified
+ALTER TABLE awards
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
@@ -0,0 +1,29 @@
+-- ======================
+-- JOBS (background queue, see jobs.py / worker.py)
+-- ======================
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id SERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    progress REAL NOT NULL DEFAULT 0,      -- 0..1
+    progress_note TEXT,
+    result JSONB,
+    last_error TEXT,
+    locked_by VARCHAR(100),
+    created_by_email VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Claim order for workers; only queued rows are indexed
+CREATE INDEX IF NOT EXISTS jobs_queued_idx
+    ON jobs(run_after, job_id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS jobs_running_idx
+    ON jobs(heartbeat_at) WHERE status = 'running';
@@ -0,0 +1,25 @@
+-- ======================
+-- AI REVIEW (see ai_review.py)
+-- ======================
+-- llm_responses also records award line-item reviews (no transaction)
+ALTER TABLE llm_responses
+  ADD COLUMN IF NOT EXISTS award_id INTEGER
+    REFERENCES awards(award_id) ON DELETE CASCADE;
+ALTER TABLE llm_responses
+  ADD COLUMN IF NOT EXISTS line_item_ref VARCHAR(100);
+ALTER TABLE llm_responses
+  ADD COLUMN IF NOT EXISTS item_hash CHAR(40);
+CREATE INDEX IF NOT EXISTS llm_responses_award_id_idx
+    ON llm_responses(award_id);
+
+-- Reviewer decision per hash of (normalized line item, policy version), so
+-- an unchanged item is never sent to the model twice
+CREATE TABLE IF NOT EXISTS llm_decision_cache (
+    item_hash CHAR(40) PRIMARY KEY,
+    policy_version CHAR(40) NOT NULL,
+    llm_decision VARCHAR(30) NOT NULL
+        CHECK (llm_decision IN ('Allow', 'Allow with Prior Approval', 'Disallow')),
+    reason TEXT,
+    backend VARCHAR(50),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,8 @@
+-- ======================
+-- TRANSACTION INGESTION (see ingest.py)
+-- ======================
+-- Finance system's id for a charge; re-importing it updates the row
+ALTER TABLE transactions
+  ADD COLUMN IF NOT EXISTS external_id VARCHAR(100);
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_external_id_idx
+    ON transactions(external_id) WHERE external_id IS NOT NULL;
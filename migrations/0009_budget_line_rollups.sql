@@ -0,0 +1,10 @@
+-- ======================
+-- BUDGET LINE ROLLUPS (see budget_lines.py)
+-- ======================
+-- One line per award and category; spent_amount is the sum of the award's
+-- Approved transactions in that category, maintained incrementally by
+-- writers and checked by the reconcile_budget_lines job
+CREATE UNIQUE INDEX IF NOT EXISTS budget_lines_award_category_idx
+    ON budget_lines(award_id, category);
+ALTER TABLE budget_lines
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
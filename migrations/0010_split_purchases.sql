@@ -0,0 +1,33 @@
+-- ======================
+-- SPLIT PURCHASE DETECTION (see split_purchases.py)
+-- ======================
+-- Scans walk each award's transactions in date order
+CREATE INDEX IF NOT EXISTS transactions_award_date_idx
+    ON transactions(award_id, date_submitted, transaction_id);
+
+-- Orders under the bidding threshold that together reach it
+CREATE TABLE IF NOT EXISTS split_purchase_flags (
+    flag_id SERIAL PRIMARY KEY,
+    award_id INTEGER NOT NULL,
+    category VARCHAR(100),
+    user_id INTEGER,
+    first_date DATE,
+    last_date DATE,
+    order_count INTEGER,
+    total_amount DECIMAL(14,2),
+    threshold DECIMAL(14,2),
+    transaction_ids INTEGER[] NOT NULL,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT split_purchase_flags_award_id_fkey FOREIGN KEY (award_id)
+        REFERENCES awards(award_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS split_purchase_flags_award_id_idx
+    ON split_purchase_flags(award_id);
+
+-- Awards whose transactions changed since the last incremental scan
+CREATE TABLE IF NOT EXISTS split_purchase_pending (
+    award_id INTEGER PRIMARY KEY,
+    CONSTRAINT split_purchase_pending_award_id_fkey FOREIGN KEY (award_id)
+        REFERENCES awards(award_id) ON DELETE CASCADE
+);
@@ -0,0 +1,6 @@
+-- ======================
+-- SUBMIT-TIME BUDGET CHECKS (see budget_checks.py)
+-- ======================
+-- Problems that kept the award from entering review; NULL once it passes
+ALTER TABLE awards
+  ADD COLUMN IF NOT EXISTS validation_errors JSONB;
@@ -0,0 +1,15 @@
+-- ======================
+-- AWARD SEARCH (see award_search.py)
+-- ======================
+-- Weighted document: title > keywords / PI email > abstract > collaborators.
+-- The email is split on @ and . so "jsmith" or the domain match on their own.
+ALTER TABLE awards
+  ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+      setweight(to_tsvector('english', coalesce(title, '')), 'A')
+   || setweight(to_tsvector('english', coalesce(keywords, '')), 'B')
+   || setweight(to_tsvector('simple', translate(coalesce(created_by_email, ''), '@.', '  ')), 'B')
+   || setweight(to_tsvector('english', coalesce(abstract, '')), 'C')
+   || setweight(to_tsvector('english', coalesce(collaborators, '')), 'D')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS awards_search_idx ON awards USING GIN (search_vector);
@@ -0,0 +1,138 @@
+-- ======================
+-- LINE ITEMS: ONE STORE (see line_items.py)
+-- ======================
+-- The detail tables become the only copy of an award's budget; the JSON the
+-- form and exports need is aggregated from them on read.
+
+-- Hours per person and year (personnel_expenses.hours_for_years keeps the sum)
+CREATE TABLE IF NOT EXISTS personnel_hours (
+    hours_id SERIAL PRIMARY KEY,
+    personnel_id INTEGER NOT NULL,
+    year INTEGER,                           -- NULL when the award had no period yet
+    hours DECIMAL(10,2) NOT NULL,
+    CONSTRAINT personnel_hours_personnel_id_fkey FOREIGN KEY (personnel_id)
+        REFERENCES personnel_expenses(personnel_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS personnel_hours_personnel_id_idx
+    ON personnel_hours(personnel_id);
+
+-- The app read the JSON blobs, so the detail rows are rebuilt from them.
+-- Same field fallbacks as the app's *_row helpers; garbage numbers and
+-- dates become NULL, items without an id get a stable one.
+CREATE FUNCTION pg_temp.num(value text) RETURNS numeric AS $$
+BEGIN
+    RETURN trim(value)::numeric;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE FUNCTION pg_temp.day(value text) RETURNS date AS $$
+BEGIN
+    RETURN trim(value)::date;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE FUNCTION pg_temp.items(value jsonb) RETURNS jsonb AS $$
+    SELECT CASE jsonb_typeof(value) WHEN 'array' THEN value ELSE '[]' END
+$$ LANGUAGE sql IMMUTABLE;
+
+DELETE FROM personnel_expenses;
+DELETE FROM travel_expenses;
+DELETE FROM material_supplies;
+
+-- 1) Personnel (a name is required) and their hours
+CREATE TEMP TABLE personnel_items ON COMMIT DROP AS
+SELECT award_id, n, item,
+       CASE WHEN item_id IS NULL
+                 OR row_number() OVER (PARTITION BY award_id, item_id ORDER BY n) > 1
+            THEN md5(award_id || ':personnel:' || n) ELSE item_id END AS line_item_id
+FROM (
+    SELECT a.award_id, e.n, e.item, NULLIF(left(trim(e.item->>'id'), 64), '') AS item_id
+    FROM awards a,
+         jsonb_array_elements(pg_temp.items(a.personnel_json)) WITH ORDINALITY AS e(item, n)
+    WHERE jsonb_typeof(e.item) = 'object'
+      AND trim(COALESCE(e.item->>'name', '')) <> ''
+) items;
+
+INSERT INTO personnel_expenses
+    (award_id, line_item_id, person_name, position_title, hours_for_years, same_each_year)
+SELECT i.award_id, i.line_item_id,
+       left(trim(i.item->>'name'), 200),
+       NULLIF(left(trim(i.item->>'position'), 200), ''),
+       (SELECT NULLIF(SUM(pg_temp.num(h->>'hours')), 0)
+        FROM jsonb_array_elements(pg_temp.items(i.item->'hours')) h
+        WHERE jsonb_typeof(h) = 'object'),
+       COALESCE(i.item->'same_each_year' = 'true', FALSE)
+FROM personnel_items i
+ORDER BY i.award_id, i.n;
+
+INSERT INTO personnel_hours (personnel_id, year, hours)
+SELECT p.personnel_id, trunc(pg_temp.num(h.value->>'year'))::int, pg_temp.num(h.value->>'hours')
+FROM personnel_items i
+JOIN personnel_expenses p ON p.award_id = i.award_id AND p.line_item_id = i.line_item_id
+CROSS JOIN LATERAL jsonb_array_elements(pg_temp.items(i.item->'hours')) WITH ORDINALITY AS h(value, n)
+WHERE jsonb_typeof(h.value) = 'object'
+  AND pg_temp.num(h.value->>'hours') IS NOT NULL
+ORDER BY p.personnel_id, h.n;
+
+-- 2) Travel, domestic then international
+INSERT INTO travel_expenses
+    (award_id, line_item_id, travel_type, travel_name, description, year,
+     start_date, end_date, flight_cost, taxi_per_day, food_lodge_per_day, num_days)
+SELECT award_id,
+       CASE WHEN item_id IS NULL
+                 OR row_number() OVER (PARTITION BY award_id, item_id ORDER BY list_n, n) > 1
+            THEN md5(award_id || ':' || travel_type || ':' || n) ELSE item_id END,
+       travel_type,
+       NULLIF(left(trim(COALESCE(NULLIF(item->>'travel_name', ''), item->>'name')), 255), ''),
+       NULLIF(trim(item->>'description'), ''),
+       trunc(pg_temp.num(item->>'year'))::int,
+       pg_temp.day(COALESCE(NULLIF(item->>'start_date', ''), item->>'depart')),
+       pg_temp.day(COALESCE(NULLIF(item->>'end_date', ''), item->>'arrive')),
+       pg_temp.num(COALESCE(NULLIF(item->>'flight_cost', ''), item->>'flight')),
+       pg_temp.num(item->>'taxi_per_day'),
+       pg_temp.num(COALESCE(NULLIF(item->>'food_lodge_per_day', ''), item->>'food_per_day')),
+       trunc(pg_temp.num(COALESCE(NULLIF(item->>'days', ''), item->>'num_days')))::int
+FROM (
+    SELECT a.award_id, l.list_n, l.travel_type, e.n, e.item,
+           NULLIF(left(trim(e.item->>'id'), 64), '') AS item_id
+    FROM awards a
+    CROSS JOIN LATERAL (VALUES (1, 'Domestic', a.domestic_travel_json),
+                               (2, 'International', a.international_travel_json))
+        AS l(list_n, travel_type, items)
+    CROSS JOIN LATERAL jsonb_array_elements(pg_temp.items(l.items)) WITH ORDINALITY AS e(item, n)
+    WHERE jsonb_typeof(e.item) = 'object'
+) items
+ORDER BY award_id, list_n, n;
+
+-- 3) Materials and supplies
+INSERT INTO material_supplies (award_id, line_item_id, material_type, cost, description, year)
+SELECT award_id,
+       CASE WHEN item_id IS NULL
+                 OR row_number() OVER (PARTITION BY award_id, item_id ORDER BY n) > 1
+            THEN md5(award_id || ':materials:' || n) ELSE item_id END,
+       NULLIF(left(trim(COALESCE(NULLIF(item->>'material_type', ''), item->>'category')), 255), ''),
+       pg_temp.num(item->>'cost'),
+       NULLIF(trim(item->>'description'), ''),
+       trunc(pg_temp.num(item->>'year'))::int
+FROM (
+    SELECT a.award_id, e.n, e.item, NULLIF(left(trim(e.item->>'id'), 64), '') AS item_id
+    FROM awards a,
+         jsonb_array_elements(pg_temp.items(a.materials_json)) WITH ORDINALITY AS e(item, n)
+    WHERE jsonb_typeof(e.item) = 'object'
+) items
+ORDER BY award_id, n;
+
+DROP FUNCTION pg_temp.num(text);
+DROP FUNCTION pg_temp.day(text);
+DROP FUNCTION pg_temp.items(jsonb);
+
+ALTER TABLE awards
+  DROP COLUMN IF EXISTS personnel_json,
+  DROP COLUMN IF EXISTS domestic_travel_json,
+  DROP COLUMN IF EXISTS international_travel_json,
+  DROP COLUMN IF EXISTS materials_json;
@@ -0,0 +1,84 @@
+-- ======================
+-- PORTFOLIO ANALYTICS (see portfolio.py)
+-- ======================
+-- Summary tables behind the admin portfolio endpoint, maintained
+-- incrementally by the writers and rebuilt by the refresh_portfolio job.
+-- Awards are keyed by college / department / sponsor_type ('' when unset)
+-- and the fiscal year they start in (0 when unset).
+
+-- Approved awards, their committed amount and Approved spend per key
+CREATE TABLE IF NOT EXISTS portfolio_summary (
+    college VARCHAR(255) NOT NULL DEFAULT '',
+    department VARCHAR(255) NOT NULL DEFAULT '',
+    sponsor_type VARCHAR(50) NOT NULL DEFAULT '',
+    fiscal_year INTEGER NOT NULL DEFAULT 0,
+    approved_awards INTEGER NOT NULL DEFAULT 0,
+    committed_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+    spent_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (college, department, sponsor_type, fiscal_year)
+);
+
+-- The same spend by calendar month of date_submitted (burn rate)
+CREATE TABLE IF NOT EXISTS portfolio_monthly_spend (
+    college VARCHAR(255) NOT NULL DEFAULT '',
+    department VARCHAR(255) NOT NULL DEFAULT '',
+    sponsor_type VARCHAR(50) NOT NULL DEFAULT '',
+    fiscal_year INTEGER NOT NULL DEFAULT 0,
+    month DATE NOT NULL,
+    spent_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (college, department, sponsor_type, fiscal_year, month)
+);
+
+CREATE INDEX IF NOT EXISTS portfolio_monthly_spend_month_idx
+    ON portfolio_monthly_spend(month);
+
+-- Approved awards and their commitment per end date ("ending within N days")
+CREATE TABLE IF NOT EXISTS portfolio_endings (
+    end_date DATE PRIMARY KEY,
+    approved_awards INTEGER NOT NULL DEFAULT 0,
+    committed_amount DECIMAL(15,2) NOT NULL DEFAULT 0
+);
+
+-- The soonest-ending Approved awards, listed by the endpoint
+CREATE INDEX IF NOT EXISTS awards_approved_end_date_idx
+    ON awards(end_date, award_id) WHERE status = 'Approved';
+
+-- Initial fill; fiscal years start in July (portfolio.FISCAL_YEAR_START_MONTH)
+INSERT INTO portfolio_summary
+    (college, department, sponsor_type, fiscal_year,
+     approved_awards, committed_amount, spent_amount)
+SELECT COALESCE(a.college, ''), COALESCE(a.department, ''), COALESCE(a.sponsor_type, ''),
+       COALESCE(EXTRACT(YEAR FROM a.start_date)::int
+                + (EXTRACT(MONTH FROM a.start_date) >= 7)::int, 0),
+       COUNT(*) FILTER (WHERE a.status = 'Approved'),
+       COALESCE(SUM(a.amount) FILTER (WHERE a.status = 'Approved'), 0),
+       COALESCE(SUM(s.spent), 0)
+FROM awards a
+LEFT JOIN (
+    SELECT award_id, SUM(amount) AS spent
+    FROM transactions
+    WHERE status = 'Approved'
+    GROUP BY award_id
+) s ON s.award_id = a.award_id
+GROUP BY 1, 2, 3, 4
+HAVING COUNT(*) FILTER (WHERE a.status = 'Approved') > 0 OR SUM(s.spent) <> 0;
+
+INSERT INTO portfolio_monthly_spend
+    (college, department, sponsor_type, fiscal_year, month, spent_amount)
+SELECT COALESCE(a.college, ''), COALESCE(a.department, ''), COALESCE(a.sponsor_type, ''),
+       COALESCE(EXTRACT(YEAR FROM a.start_date)::int
+                + (EXTRACT(MONTH FROM a.start_date) >= 7)::int, 0),
+       date_trunc('month', t.date_submitted)::date,
+       SUM(t.amount)
+FROM transactions t
+JOIN awards a ON a.award_id = t.award_id
+WHERE t.status = 'Approved' AND t.date_submitted IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5
+HAVING SUM(t.amount) <> 0;
+
+INSERT INTO portfolio_endings (end_date, approved_awards, committed_amount)
+SELECT end_date, COUNT(*), COALESCE(SUM(amount), 0)
+FROM awards
+WHERE status = 'Approved' AND end_date IS NOT NULL
+GROUP BY end_date;
@@ -0,0 +1,13 @@
+-- ======================
+-- AWARDS: created_at IS REQUIRED
+-- ======================
+-- Dashboard pages are walked with a (created_at, award_id) keyset cursor,
+-- which cannot point past a NULL created_at. Legacy rows without one take
+-- their last update time, or the epoch when that is missing too.
+UPDATE awards
+SET created_at = COALESCE(updated_at, TIMESTAMP 'epoch')
+WHERE created_at IS NULL;
+
+ALTER TABLE awards
+  ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP,
+  ALTER COLUMN created_at SET NOT NULL;
@@ -0,0 +1,48 @@
+-- ======================
+-- PERSONNEL IN HOURS; BUDGET BY YEAR (see budget_calc.py, portfolio.py)
+-- ======================
+-- The form collects personnel hours but no rate, so personnel is no longer
+-- priced: budget_personnel goes back to NULL and leaves total_budget.
+UPDATE awards
+SET total_budget = total_budget - budget_personnel,
+    budget_personnel = NULL
+WHERE budget_personnel IS NOT NULL;
+
+-- Itemized budget of the submitted (non-Draft) awards per year, kept by
+-- the writers for the admin dashboard. Undated items count toward the
+-- award's start year (-1 when it has none).
+CREATE TABLE IF NOT EXISTS portfolio_budget_years (
+    year INTEGER PRIMARY KEY,
+    equipment DECIMAL(15,2) NOT NULL DEFAULT 0,
+    travel DECIMAL(15,2) NOT NULL DEFAULT 0,
+    materials DECIMAL(15,2) NOT NULL DEFAULT 0,
+    personnel_hours DECIMAL(15,2) NOT NULL DEFAULT 0
+);
+
+-- Initial fill, valued like budget_calc.stored_items_sql
+INSERT INTO portfolio_budget_years (year, equipment, travel, materials, personnel_hours)
+SELECT COALESCE(i.year, EXTRACT(YEAR FROM a.start_date)::int, -1),
+       COALESCE(SUM(i.amount) FILTER (WHERE i.category = 'equipment'), 0),
+       COALESCE(SUM(i.amount) FILTER (WHERE i.category = 'travel'), 0),
+       COALESCE(SUM(i.amount) FILTER (WHERE i.category = 'materials'), 0),
+       COALESCE(SUM(i.amount) FILTER (WHERE i.category = 'hours'), 0)
+FROM awards a
+JOIN (
+    SELECT p.award_id, h.year, 'hours' AS category, h.hours AS amount
+    FROM personnel_expenses p
+    JOIN personnel_hours h USING (personnel_id)
+    UNION ALL
+    SELECT t.award_id, t.year, 'travel',
+           COALESCE(t.flight_cost, 0)
+           + (COALESCE(t.taxi_per_day, 0) + COALESCE(t.food_lodge_per_day, 0))
+             * COALESCE(t.num_days, 0)
+    FROM travel_expenses t
+    UNION ALL
+    SELECT m.award_id, m.year,
+           CASE WHEN starts_with(lower(trim(m.material_type)), 'equipment')
+                THEN 'equipment' ELSE 'materials' END,
+           COALESCE(m.cost, 0)
+    FROM material_supplies m
+) i ON i.award_id = a.award_id
+WHERE a.status <> 'Draft'
+GROUP BY 1;
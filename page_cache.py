@@ -0,0 +1,157 @@
+"""Bounded cache for rendered pages (award views, the policies page).
+
+Keys carry a version of everything the page shows -- for an award view a
+hash of the award row, its budget lines and split-purchase flags, plus the
+compiled policy digest -- so a mutation makes older renders unreachable in
+every worker at once. Reading a version is one small query, far cheaper
+than the page. ``invalidate`` frees a mutated award's renders early, and
+entries expire after PAGE_CACHE_TTL seconds regardless.
+
+The in-process tier is an LRU bounded by total bytes. Setting
+PAGE_CACHE_DIR adds an on-disk tier shared by all workers on the host,
+bounded by PAGE_CACHE_DIR_MAX_BYTES: expired files, and then the oldest
+ones, are deleted once the directory outgrows it (renders under a
+superseded version are never read again and age out the same way).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from export_cache import PRUNE_EVERY_FRACTION, prune_directory
+
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR") or None
+PAGE_CACHE_DIR_MAX_BYTES = int(os.getenv("PAGE_CACHE_DIR_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class PageCache:
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL,
+                 directory=PAGE_CACHE_DIR, dir_max_bytes=PAGE_CACHE_DIR_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.dir_max_bytes = dir_max_bytes
+        self._written = 0               # bytes written to the directory since the last prune
+        self._entries = OrderedDict()   # key -> (expires_at, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            prune_directory(directory, dir_max_bytes, max_age=ttl)
+
+    def _path(self, key):
+        # "<page>-<id>-<hash of the full key>" so invalidate can match by prefix
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{key[0]}-{key[1]}-{digest}.html")
+
+    def get(self, key):
+        """The cached page for ``key`` (bytes), or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                self._bytes -= len(self._entries.pop(key)[1])
+        if self.directory:
+            try:
+                path = self._path(key)
+                expires_at = os.stat(path).st_mtime + self.ttl
+                with open(path, "rb") as f:
+                    data = f.read() if expires_at > now else None
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, data, expires_at)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, page):
+        """Cache a rendered page (str or bytes); returns it as bytes."""
+        data = page.encode() if isinstance(page, str) else page
+        self._remember(key, data, time.time() + self.ttl)
+        if self.directory and self.accepts(len(data)):
+            # Write-then-rename so other workers never read a partial file
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._path(key))
+            except OSError as e:
+                print(f"Page cache write error: {e}")
+                return data
+            self._wrote(len(data))
+        return data
+
+    def _wrote(self, size):
+        with self._lock:
+            self._written += size
+            if self._written < self.dir_max_bytes * PRUNE_EVERY_FRACTION:
+                return
+            self._written = 0
+        # mtime is the write time (hits don't touch it: it sets the expiry)
+        prune_directory(self.directory, self.dir_max_bytes, max_age=self.ttl)
+
+    def accepts(self, size):
+        return self.ttl > 0 and size <= self.max_bytes
+
+    def _remember(self, key, data, expires_at):
+        if not self.accepts(len(data)):
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (expires_at, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def invalidate(self, page, ident):
+        """Drop every cached render of one page, e.g. ("award_view", award_id)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[:2] == (page, ident)]:
+                self._bytes -= len(self._entries.pop(key)[1])
+        if self.directory:
+            prefix = f"{page}-{ident}-"
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+            for name in names:
+                if name.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "dir_max_bytes": self.dir_max_bytes if self.directory else None,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+page_cache = PageCache()
@@ -0,0 +1,259 @@
+"""BM25 retrieval index over policy clauses, shared through a memory map.
+
+Each Allowed / Not Allowed / Required / Rule / Violations clause of the
+compiled policies is one chunk. The index is built at deploy time:
+
+    python policy_index.py [--out policy_index.bin] [--no-db]
+
+and written as a single file: a JSON header (vocabulary, chunk metadata,
+policy digest) followed by the posting arrays, which every gunicorn worker
+maps read-only with numpy.memmap, so the pages are shared by the OS instead
+of each worker building its own copy.
+
+``get_index(rules)`` returns the index for the current compiled policies;
+if the file is missing or was built from other policy text it is rebuilt in
+memory (and a warning printed) until the next deploy rebuilds the file.
+"""
+import argparse
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+from collections import Counter
+
+import numpy as np
+
+from policy_rules import content_tokens
+
+POLICY_INDEX_PATH = os.getenv(
+    "POLICY_INDEX_PATH", os.path.join(os.path.dirname(__file__), "policy_index.bin")
+)
+# Clauses returned per line item when building review prompts
+POLICY_CONTEXT_K = int(os.getenv("POLICY_CONTEXT_K", "4"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_MAGIC = b"GGPIDX01"
+_ALIGN = 64
+# name -> dtype of the arrays stored after the header
+_ARRAYS = (
+    ("indptr", "<i8"),          # postings of term t: indptr[t]:indptr[t+1]
+    ("doc_ids", "<i4"),         # chunk id per posting
+    ("weights", "<f4"),         # BM25 weight per posting
+    ("chunk_category", "<i2"),  # category code per chunk, -1 = none
+)
+
+
+class PolicyIndex:
+    """Read-only BM25 index; see ``build`` / ``load`` / ``search``."""
+
+    def __init__(self, digest, vocab, chunks, categories, arrays):
+        self.digest = digest
+        self.vocab = vocab              # term -> term id
+        self.chunks = chunks            # [{id, level, source, heading, category, kind, clause}]
+        self.categories = categories    # category code -> name
+        self._category_codes = {c: i for i, c in enumerate(categories)}
+        self.indptr = arrays["indptr"]
+        self.doc_ids = arrays["doc_ids"]
+        self.weights = arrays["weights"]
+        self.chunk_category = arrays["chunk_category"]
+
+    @classmethod
+    def build(cls, rules):
+        """Index every clause of a compiled policy_rules.RuleSet."""
+        chunks = []
+        for level, source, section in rules.sections:
+            for kind, clause in section["clauses"]:
+                chunks.append({
+                    "id": len(chunks),
+                    "level": level,
+                    "source": source,
+                    "heading": section["heading"],
+                    "category": section["category"],
+                    "kind": kind,
+                    "clause": clause,
+                })
+
+        # The heading is indexed with the clause so "laptop" also finds
+        # clauses that only make sense under "Equipment"
+        docs = [Counter(content_tokens(f"{c['heading']} {c['clause']}")) for c in chunks]
+        n_docs = len(docs)
+        avgdl = (sum(sum(d.values()) for d in docs) / n_docs) if n_docs else 0.0
+
+        postings = {}
+        for doc_id, tf in enumerate(docs):
+            for term, count in tf.items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        vocab = {term: i for i, term in enumerate(sorted(postings))}
+        indptr = np.zeros(len(vocab) + 1, dtype="<i8")
+        doc_ids, weights = [], []
+        for term, term_id in vocab.items():
+            plist = postings[term]
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, count in plist:
+                dl = sum(docs[doc_id].values())
+                norm = count + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl)
+                doc_ids.append(doc_id)
+                weights.append(idf * count * (BM25_K1 + 1) / norm)
+            indptr[term_id + 1] = len(doc_ids)
+
+        categories = sorted({c["category"] for c in chunks if c["category"]})
+        codes = {c: i for i, c in enumerate(categories)}
+        arrays = {
+            "indptr": indptr,
+            "doc_ids": np.asarray(doc_ids, dtype="<i4"),
+            "weights": np.asarray(weights, dtype="<f4"),
+            "chunk_category": np.asarray(
+                [codes.get(c["category"], -1) for c in chunks], dtype="<i2"
+            ),
+        }
+        return cls(rules.digest, vocab, chunks, categories, arrays)
+
+    def save(self, path):
+        """Write the index file atomically (tmp file + rename)."""
+        arrays = {name: np.ascontiguousarray(getattr(self, name), dtype=dtype)
+                  for name, dtype in _ARRAYS}
+        layout = {}
+        offset = 0
+        for name, dtype in _ARRAYS:
+            layout[name] = {"dtype": dtype, "offset": offset, "length": int(arrays[name].size)}
+            offset += arrays[name].nbytes
+            offset += -offset % _ALIGN
+        header = json.dumps({
+            "digest": self.digest,
+            "terms": sorted(self.vocab, key=self.vocab.get),
+            "chunks": self.chunks,
+            "categories": self.categories,
+            "arrays": layout,
+        }).encode()
+        data_start = len(_MAGIC) + 8 + len(header)
+        data_start += -data_start % _ALIGN
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_MAGIC)
+                f.write(struct.pack("<Q", len(header)))
+                f.write(header)
+                f.write(b"\0" * (data_start - f.tell()))
+                for name, _dtype in _ARRAYS:
+                    f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+                    f.write(arrays[name].tobytes())
+            # Read by every worker, possibly under another user than the build
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Map an index file written by ``save``; the arrays stay on disk."""
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a policy index file")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len))
+        data_start = len(_MAGIC) + 8 + header_len
+        data_start += -data_start % _ALIGN
+
+        arrays = {}
+        for name, _dtype in _ARRAYS:
+            spec = header["arrays"][name]
+            if spec["length"] == 0:
+                arrays[name] = np.zeros(0, dtype=spec["dtype"])
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=spec["dtype"], mode="r",
+                offset=data_start + spec["offset"], shape=(spec["length"],),
+            )
+        vocab = {term: i for i, term in enumerate(header["terms"])}
+        return cls(header["digest"], vocab, header["chunks"], header["categories"], arrays)
+
+    def search(self, text, k=POLICY_CONTEXT_K, category=None):
+        """
+        Top-k clauses for a line item's text as [(score, chunk)], best
+        first. With ``category`` only that category's clauses are ranked
+        (unless the policies have none for it).
+        """
+        term_ids = {self.vocab[t] for t in content_tokens(text) if t in self.vocab}
+        if not term_ids or k <= 0:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for t in term_ids:
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            scores[self.doc_ids[lo:hi]] += self.weights[lo:hi]
+
+        code = self._category_codes.get(category)
+        if code is not None:
+            scores[self.chunk_category != code] = 0
+
+        hits = np.flatnonzero(scores)
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(float(scores[i]), self.chunks[i]) for i in hits]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(rules, path=POLICY_INDEX_PATH):
+    """The index matching ``rules`` (a compiled RuleSet), mapped from ``path``."""
+    global _index
+    index = _index
+    if index is not None and index.digest == rules.digest:
+        return index
+    with _index_lock:
+        if _index is None or _index.digest != rules.digest:
+            loaded = None
+            try:
+                loaded = PolicyIndex.load(path)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Policy index {path} unreadable: {e}")
+            if loaded is None or loaded.digest != rules.digest:
+                print("Policy index missing or stale; building it in memory "
+                      "(run `python policy_index.py` at deploy)")
+                loaded = PolicyIndex.build(rules)
+            _index = loaded
+    return _index
+
+
+def main(argv=None):
+    from policy_rules import compile_rules, load_policy_sources
+
+    parser = argparse.ArgumentParser(description="Build the policy retrieval index")
+    parser.add_argument("--out", default=POLICY_INDEX_PATH, help="index file to write")
+    parser.add_argument("--no-db", action="store_true",
+                        help="index policies/*.txt only, not the policies table")
+    args = parser.parse_args(argv)
+
+    sources = None
+    if not args.no_db:
+        try:
+            from db import db_connection
+            with db_connection() as conn:
+                cur = conn.cursor()
+                sources = load_policy_sources(cur)
+                cur.close()
+        except Exception as e:
+            print(f"Could not read the policies table ({e}); indexing files only")
+    if sources is None:
+        sources = load_policy_sources()
+
+    index = PolicyIndex.build(compile_rules(sources))
+    index.save(args.out)
+    print(f"Wrote {args.out}: {len(index.chunks)} clauses, {len(index.vocab)} terms "
+          f"(policy version {index.digest[:8]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""Compiled screening rules built from the policy texts.
+
+The federal, sponsor and university policies (policies/*.txt, plus any rows
+in the ``policies`` table) are written as paragraphs of the form
+
+    Equipment Allowed: - ... Not Allowed: - ... Rule: ... Violations: - ...
+
+``compile_rules`` turns them into a RuleSet: one word-level Aho-Corasick
+automaton per budget category, built from the key phrases of every
+"Not Allowed" and "Violations" clause, plus the dollar thresholds the texts
+state ("Equipment above $5,000 with approval", "10k" bidding rule).
+``RuleSet.screen`` then checks any number of line items in a single pass
+over their text.
+
+``get_rules`` keeps the compiled set per process and only recompiles when
+a policy file or the policies table changes.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import defaultdict
+
+POLICY_DIR = os.getenv("POLICY_DIR", os.path.join(os.path.dirname(__file__), "policies"))
+
+# File name -> policy level (same values as policies.policy_level)
+POLICY_FILE_LEVELS = {
+    "federal_policy.txt": "Federal",
+    "sponsor_policy.txt": "Sponsor",
+    "university_policy.txt": "University",
+}
+
+# Section heading prefix -> budget category
+CATEGORY_PREFIXES = (
+    ("personnel", "Personnel"),
+    ("equipment", "Equipment"),
+    ("travel", "Travel"),
+    ("materials", "Materials"),
+    ("subaward", "Subawards"),
+    ("participant", "Participant Support"),
+    ("documentation", "Documentation"),
+    ("other direct", "Other Direct Costs"),
+)
+
+# llm_responses.llm_decision values
+DISALLOW = "Disallow"
+NEEDS_APPROVAL = "Allow with Prior Approval"
+
+_MARKER_RE = re.compile(r"\b(Not Allowed|Allowed|Required|Rule|Violations)\s*:")
+_BULLET_RE = re.compile(r"(?:^|\s)-\s+")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_ALTERNATIVE_RE = re.compile(r"\b([a-z][a-z\-]*)/([a-z][a-z\-]*)\b")
+_AMOUNT_RE = re.compile(r"\$\s*(\d[\d,]*(?:\.\d+)?)\s*(k)?\b|\b(\d+(?:\.\d+)?)\s*k\b", re.I)
+# Clauses that are only a problem when an approval/exception is missing
+_CONDITIONAL_RE = re.compile(
+    r"\b(without|unless|ignoring|not (?:listed|planned|budgeted|related)|not in)\b", re.I
+)
+
+# Words that split a clause into key phrases (RAKE-style) and never match
+# on their own
+_STOPWORDS = frozenset("""
+    a an and any are as at be by did do for from if in into is it its more
+    not of on or than that the their them they to was were who with without
+    unless someone equal only must new extra two
+    buying charging paying adding hiring creating attending bringing flying
+    purchasing using ignoring splitting missing charged avoid no
+""".split())
+
+# Single words too common in budgets to flag by themselves; they still
+# count inside longer phrases ("admin staff", "business class")
+_GENERIC_WORDS = frozenset("""
+    salary salaries personnel staff people pi co-pi effort work project
+    projects research equipment travel purchase purchases order orders
+    item items cost costs fund funds grant approval approved proposal
+    justification explanation exception exceptions apply rate normal
+    related necessary needed future another general large lab dedicated
+    listed planned required budgeted bidding rule rules documentation
+    individual individuals contract contracts quote quotes receipt
+""".split())
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lower-cased, lightly stemmed word tokens ("Cameras'" -> "camera")."""
+    text = (text or "").lower().replace("’", "'").replace("'s", "")
+    return [_stem(w) for w in _TOKEN_RE.findall(text)]
+
+
+def content_tokens(text):
+    """tokenize() minus stopwords (what the policy retrieval index ranks on)."""
+    text = (text or "").lower().replace("’", "'").replace("'s", "")
+    return [_stem(w) for w in _TOKEN_RE.findall(text) if w not in _STOPWORDS]
+
+
+_STEMMED_GENERIC = frozenset(_stem(w) for w in _GENERIC_WORDS)
+
+
+def key_phrases(clause):
+    """
+    Split a clause at stopwords and punctuation into candidate phrases.
+    "Buying cameras not related to the project" -> [("camera",)]
+    "Business/first class" -> [("business", "class"), ("first", "class")]
+    """
+    text = (clause or "").lower().replace("’", "'").replace("'s", "")
+    # Expand "a/b c" into "a c" and "b c"
+    variants = [text]
+    m = _ALTERNATIVE_RE.search(text)
+    if m:
+        variants = [text[:m.start()] + alt + text[m.end():] for alt in m.groups()]
+
+    phrases = []
+    for variant in variants:
+        for chunk in re.split(r"[^a-z0-9\-\s]+", variant):
+            run = []
+            for word in _TOKEN_RE.findall(chunk):
+                if word in _STOPWORDS or word[0].isdigit():
+                    if run:
+                        phrases.append(tuple(run))
+                    run = []
+                else:
+                    run.append(_stem(word))
+            if run:
+                phrases.append(tuple(run))
+    # A phrase needs at least one word that is not generic budget language
+    return list(dict.fromkeys(
+        p for p in phrases
+        if any(w not in _STEMMED_GENERIC and len(w) > 1 for w in p)
+    ))
+
+
+def parse_amounts(text):
+    """Dollar amounts mentioned in a clause: "$5,000" -> 5000.0, "10k" -> 10000.0"""
+    amounts = []
+    for m in _AMOUNT_RE.finditer(text or ""):
+        if m.group(1):
+            value = float(m.group(1).replace(",", ""))
+            if m.group(2):
+                value *= 1000
+        else:
+            value = float(m.group(3)) * 1000
+        amounts.append(value)
+    return amounts
+
+
+def category_for(heading):
+    h = (heading or "").strip().lower()
+    for prefix, category in CATEGORY_PREFIXES:
+        if h.startswith(prefix):
+            return category
+    return None
+
+
+def parse_policy(text):
+    """
+    Split one policy document into sections:
+    [{"heading", "category", "clauses": [(kind, text)]}] where kind is one
+    of "Allowed", "Not Allowed", "Required", "Rule", "Violations".
+    Paragraphs without any marker (the document title) are skipped.
+    """
+    sections = []
+    for para in re.split(r"\n\s*\n", (text or "").strip()):
+        para = " ".join(para.split())
+        parts = _MARKER_RE.split(para)
+        if len(parts) < 3:
+            continue
+        heading = parts[0].strip()
+        clauses = []
+        for kind, body in zip(parts[1::2], parts[2::2]):
+            body = body.strip()
+            if kind == "Rule":
+                items = [body]
+            else:
+                items = _BULLET_RE.split(body)
+            for item in items:
+                item = item.strip(" .")
+                if item:
+                    clauses.append((kind, item))
+        sections.append({
+            "heading": heading,
+            "category": category_for(heading),
+            "clauses": clauses,
+        })
+    return sections
+
+
+class PhraseMatcher:
+    """Word-level Aho-Corasick automaton: phrase tuples -> payloads."""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, phrase, payload):
+        node = 0
+        for word in phrase:
+            nxt = self._goto[node].get(word)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][word] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((phrase, payload))
+        self._built = False
+
+    def build(self):
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and word not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def __len__(self):
+        return sum(len(o) for o in self._out)
+
+    def find(self, tokens):
+        """Yield (phrase, payload) for every phrase occurring in tokens."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for word in tokens:
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            if out[node]:
+                yield from out[node]
+
+
+class RuleSet:
+    """Compiled policies; see ``screen``."""
+
+    def __init__(self, digest):
+        self.digest = digest
+        self.matchers = defaultdict(PhraseMatcher)   # category -> automaton
+        self.approval_thresholds = {}   # category -> (amount, level, clause)
+        self.bidding_thresholds = {}    # category -> (amount, level, clause)
+        self.sections = []              # (level, source_name, section)
+
+    def add_section(self, level, source_name, section):
+        self.sections.append((level, source_name, section))
+        category = section["category"]
+        if category is None:
+            return
+        for kind, clause in section["clauses"]:
+            lowered = clause.lower()
+            amounts = parse_amounts(clause)
+            if amounts and "approval" in lowered and re.search(r"\b(above|over|exceed)", lowered):
+                self._keep_lowest(self.approval_thresholds, category, min(amounts), level, clause)
+            if kind == "Violations" and amounts and "avoid" in lowered:
+                # "Two 6k orders to avoid 10k rules": the rule is the larger figure
+                self._keep_lowest(self.bidding_thresholds, category, max(amounts), level, clause)
+            if kind not in ("Not Allowed", "Violations"):
+                continue
+            decision = NEEDS_APPROVAL if _CONDITIONAL_RE.search(clause) else DISALLOW
+            rule = {
+                "level": level,
+                "source": source_name,
+                "category": category,
+                "kind": kind,
+                "clause": clause,
+                "decision": decision,
+            }
+            for phrase in key_phrases(clause):
+                self.matchers[category].add(phrase, rule)
+
+    @staticmethod
+    def _keep_lowest(table, category, amount, level, clause):
+        current = table.get(category)
+        if current is None or amount < current[0]:
+            table[category] = (amount, level, clause)
+
+    def finalize(self):
+        for matcher in self.matchers.values():
+            matcher.build()
+        return self
+
+    def stats(self):
+        return {
+            "digest": self.digest,
+            "sections": len(self.sections),
+            "phrases": {c: len(m) for c, m in self.matchers.items()},
+            "approval_thresholds": {c: t[0] for c, t in self.approval_thresholds.items()},
+            "bidding_thresholds": {c: t[0] for c, t in self.bidding_thresholds.items()},
+        }
+
+    def screen(self, items):
+        """
+        Check line items against every compiled rule in one pass.
+
+        ``items`` are dicts with "ref", "category", "text" and optionally
+        "amount" and "year". Returns {ref: [finding, ...]} for flagged items
+        only; a finding has "decision", "reason", "level", "category" and
+        "clause" (plus "matched" for phrase hits).
+        """
+        findings = defaultdict(list)
+        split_groups = defaultdict(list)
+
+        for item in items:
+            ref = item["ref"]
+            category = item.get("category")
+            amount = item.get("amount")
+            tokens = tokenize(item.get("text"))
+
+            matcher = self.matchers.get(category)
+            if matcher is not None:
+                seen = set()
+                for phrase, rule in matcher.find(tokens):
+                    if id(rule) in seen:
+                        continue
+                    seen.add(id(rule))
+                    findings[ref].append({
+                        "decision": rule["decision"],
+                        "reason": f"{rule['level']} policy, {rule['category']} "
+                                  f"{rule['kind'].lower()}: {rule['clause']}",
+                        "level": rule["level"],
+                        "category": category,
+                        "clause": rule["clause"],
+                        "matched": " ".join(phrase),
+                    })
+
+            if amount is None:
+                continue
+            approval = self.approval_thresholds.get(category)
+            if approval and amount > approval[0]:
+                findings[ref].append({
+                    "decision": NEEDS_APPROVAL,
+                    "reason": f"{category} over ${approval[0]:,.0f} needs prior approval "
+                              f"({approval[1]} policy)",
+                    "level": approval[1],
+                    "category": category,
+                    "clause": approval[2],
+                })
+            bidding = self.bidding_thresholds.get(category)
+            if bidding:
+                if amount >= bidding[0]:
+                    findings[ref].append({
+                        "decision": NEEDS_APPROVAL,
+                        "reason": f"{category} purchase of ${amount:,.0f} needs competitive "
+                                  f"bidding (${bidding[0]:,.0f} rule, {bidding[1]} policy)",
+                        "level": bidding[1],
+                        "category": category,
+                        "clause": bidding[2],
+                    })
+                else:
+                    key = (category, item.get("year"), tuple(tokens))
+                    split_groups[key].append((ref, amount))
+
+        # Same item bought in several orders that are each under the bidding
+        # threshold but together reach it
+        for (category, _year, _tokens), orders in split_groups.items():
+            threshold, level, clause = self.bidding_thresholds[category]
+            total = sum(a for _, a in orders)
+            if len(orders) < 2 or total < threshold:
+                continue
+            for ref, _ in orders:
+                findings[ref].append({
+                    "decision": DISALLOW,
+                    "reason": f"Possible split purchase: {len(orders)} orders totalling "
+                              f"${total:,.0f} against the ${threshold:,.0f} bidding rule "
+                              f"({level} policy)",
+                    "level": level,
+                    "category": category,
+                    "clause": clause,
+                })
+        return dict(findings)
+
+
+def compile_rules(sources, digest=None):
+    """Build a RuleSet from [(level, source_name, text)]."""
+    rules = RuleSet(digest or sources_digest(sources))
+    for level, source_name, text in sources:
+        for section in parse_policy(text):
+            rules.add_section(level, source_name, section)
+    return rules.finalize()
+
+
+def sources_digest(sources):
+    h = hashlib.sha1()
+    for level, source_name, text in sources:
+        h.update(f"{level}\0{source_name}\0{text}\0".encode())
+    return h.hexdigest()
+
+
+def _file_signature(directory=POLICY_DIR):
+    """Cheap change check for the policy files: (name, mtime, size) tuples."""
+    sig = []
+    for name in sorted(POLICY_FILE_LEVELS):
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def _table_signature(cur):
+    if cur is None:
+        return None
+    cur.execute(
+        """
+        SELECT count(*),
+               md5(string_agg(policy_id || ':' || policy_level || ':' ||
+                              COALESCE(source_name, '') || ':' ||
+                              COALESCE(policy_text, ''), '|' ORDER BY policy_id))
+        FROM policies
+        """
+    )
+    row = cur.fetchone()
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+
+def load_policy_sources(cur=None, directory=POLICY_DIR):
+    """[(level, source_name, text)] from the policy files and policies table."""
+    sources = []
+    for name, level in sorted(POLICY_FILE_LEVELS.items()):
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                sources.append((level, name, f.read()))
+        except OSError as e:
+            print(f"Policy file {path} not readable: {e}")
+    if cur is not None:
+        cur.execute(
+            "SELECT policy_level, source_name, policy_text FROM policies ORDER BY policy_id"
+        )
+        for row in cur.fetchall():
+            if isinstance(row, dict):
+                row = (row["policy_level"], row["source_name"], row["policy_text"])
+            sources.append((row[0], row[1] or "policies table", row[2] or ""))
+    return sources
+
+
+_rules = None
+_rules_signature = None
+_rules_lock = threading.Lock()
+
+
+def get_rules(cur=None):
+    """
+    The compiled RuleSet for this process. Pass a cursor to include (and
+    watch) the policies table; without one only the files are used.
+    """
+    global _rules, _rules_signature
+    signature = (_file_signature(), _table_signature(cur))
+    if _rules is not None and signature == _rules_signature:
+        return _rules
+    with _rules_lock:
+        if _rules is None or signature != _rules_signature:
+            sources = load_policy_sources(cur)
+            digest = sources_digest(sources)
+            if _rules is None or _rules.digest != digest:
+                _rules = compile_rules(sources, digest)
+            _rules_signature = signature
+    return _rules
@@ -0,0 +1,461 @@
+"""Portfolio analytics: committed vs. spent across the awards.
+
+The admin portfolio endpoint reads three summary tables only (see
+migrations/0014_portfolio_summary.sql), so it answers in the same time
+however many awards and transactions there are:
+
+* portfolio_summary -- Approved awards, their committed amount and the
+  Approved spend per (college, department, sponsor_type, fiscal_year),
+  the fiscal year being the one the award starts in;
+* portfolio_monthly_spend -- that spend by calendar month (burn rate);
+* portfolio_endings -- Approved awards and commitment per end date;
+* portfolio_budget_years -- the itemized budget of every submitted
+  (non-Draft) award per year, for the admin dashboard.
+
+They move in the writer's transaction, like budget_lines: status changes,
+edits and deletes take the award's ``footprint`` before and after and
+call ``record_change``; transaction loads are folded in from spend_deltas
+by budget_lines.apply_spend_deltas. ``refresh`` rebuilds them all from
+awards, their line items and transactions and reports any drift.
+"""
+import os
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from budget_calc import BUDGET_CATEGORIES, AwardBudget, stored_items_sql
+
+# Fiscal year N starts on the 1st of this month in calendar year N-1
+FISCAL_YEAR_START_MONTH = 7
+# Complete calendar months averaged into the burn rate
+BURN_RATE_MONTHS = int(os.getenv("PORTFOLIO_BURN_RATE_MONTHS", "3"))
+# "Ending soon" window in days (default / largest accepted)
+ENDING_SOON_DAYS = 90
+MAX_ENDING_SOON_DAYS = 730
+# Awards listed by name under "ending soon" (the counts cover them all)
+ENDING_SOON_LIMIT = 20
+
+KEY_COLUMNS = ("college", "department", "sponsor_type", "fiscal_year")
+# portfolio_budget_years value columns, in stored_items_sql category order
+BUDGET_YEAR_COLUMNS = BUDGET_CATEGORIES + ("personnel_hours",)
+
+# What one award contributes: key is a KEY_COLUMNS tuple, budget a tuple
+# of (year, *BUDGET_YEAR_COLUMNS) rows (empty for a Draft)
+Footprint = namedtuple("Footprint", "key end_date approved amount budget")
+
+
+def _key_sql(a="a"):
+    """SELECT-list entries for KEY_COLUMNS of the awards alias ``a``."""
+    return (
+        f"COALESCE({a}.college, '') AS college, "
+        f"COALESCE({a}.department, '') AS department, "
+        f"COALESCE({a}.sponsor_type, '') AS sponsor_type, "
+        f"COALESCE(EXTRACT(YEAR FROM {a}.start_date)::int"
+        f" + (EXTRACT(MONTH FROM {a}.start_date) >= {FISCAL_YEAR_START_MONTH})::int, 0)"
+        f" AS fiscal_year"
+    )
+
+
+_KEYS = ", ".join(KEY_COLUMNS)
+
+_SUMMARY_SQL = f"""
+    SELECT {_key_sql()},
+           COUNT(*) FILTER (WHERE a.status = 'Approved') AS approved_awards,
+           COALESCE(SUM(a.amount) FILTER (WHERE a.status = 'Approved'), 0) AS committed_amount,
+           COALESCE(SUM(s.spent), 0) AS spent_amount
+    FROM awards a
+    LEFT JOIN (
+        SELECT award_id, SUM(amount) AS spent
+        FROM transactions
+        WHERE status = 'Approved'
+        GROUP BY award_id
+    ) s ON s.award_id = a.award_id
+    GROUP BY 1, 2, 3, 4
+    HAVING COUNT(*) FILTER (WHERE a.status = 'Approved') > 0 OR SUM(s.spent) <> 0
+"""
+
+_MONTHLY_SQL = f"""
+    SELECT {_key_sql()},
+           date_trunc('month', t.date_submitted)::date AS month,
+           SUM(t.amount) AS spent_amount
+    FROM transactions t
+    JOIN awards a ON a.award_id = t.award_id
+    WHERE t.status = 'Approved' AND t.date_submitted IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+    HAVING SUM(t.amount) <> 0
+"""
+
+_ENDINGS_SQL = """
+    SELECT end_date,
+           COUNT(*) AS approved_awards,
+           COALESCE(SUM(amount), 0) AS committed_amount
+    FROM awards
+    WHERE status = 'Approved' AND end_date IS NOT NULL
+    GROUP BY end_date
+"""
+
+
+def _budget_years_sql(where):
+    """portfolio_budget_years rows for the awards matching ``where``."""
+    return f"""
+        SELECT year,
+               {", ".join(f"COALESCE(SUM(amount) FILTER (WHERE category = {i}), 0) AS {c}"
+                          for i, c in enumerate(BUDGET_YEAR_COLUMNS))}
+        FROM ({stored_items_sql(where)}) items
+        GROUP BY year
+    """
+
+
+# (table, key columns, value columns, from-scratch query) for refresh
+_TABLES = (
+    ("portfolio_summary", KEY_COLUMNS,
+     ("approved_awards", "committed_amount", "spent_amount"), _SUMMARY_SQL),
+    ("portfolio_monthly_spend", KEY_COLUMNS + ("month",), ("spent_amount",), _MONTHLY_SQL),
+    ("portfolio_endings", ("end_date",), ("approved_awards", "committed_amount"), _ENDINGS_SQL),
+    ("portfolio_budget_years", ("year",), BUDGET_YEAR_COLUMNS,
+     _budget_years_sql("a.status <> 'Draft'")),
+)
+
+
+def footprint(cur, award_id):
+    """
+    What award_id currently contributes to the summaries, or None if it
+    doesn't exist. Take it with the award row locked.
+    """
+    cur = cur.connection.cursor()
+    cur.execute(
+        f"""
+        SELECT {_key_sql()}, a.end_date, a.status = 'Approved', COALESCE(a.amount, 0)
+        FROM awards a WHERE a.award_id = %s
+        """,
+        (award_id,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        cur.close()
+        return None
+    cur.execute(
+        _budget_years_sql("a.award_id = %s AND a.status <> 'Draft'") + " ORDER BY year",
+        (award_id,),
+    )
+    budget = tuple(cur.fetchall())
+    cur.close()
+    return Footprint(tuple(row[:4]), *row[4:], budget)
+
+
+def _upsert(cur, table, keys, values, rows, touch=False):
+    """Add ``rows`` (keys + values tuples) onto ``table``, in key order."""
+    if not rows:
+        return
+    columns = keys + values
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        SELECT * FROM (VALUES %s) AS v({", ".join(columns)})
+        ORDER BY {", ".join(keys)}
+        ON CONFLICT ({", ".join(keys)}) DO UPDATE
+        SET {", ".join(f"{c} = {table}.{c} + EXCLUDED.{c}" for c in values)}
+            {", updated_at = CURRENT_TIMESTAMP" if touch else ""}
+        """,
+        rows,
+    )
+
+
+def record_change(cur, award_id, before, after):
+    """
+    Move award_id's contribution from footprint ``before`` to ``after``
+    (None for an award that is new / being deleted). Call it in the
+    writer's transaction after the change -- for a delete, before the
+    DELETE, while the award's transactions are still there.
+    """
+    if before == after:
+        return
+    summary = defaultdict(lambda: [0, 0, 0])  # key -> [awards, committed, spent]
+    endings = defaultdict(lambda: [0, 0])     # end_date -> [awards, committed]
+    monthly = defaultdict(int)                # key + (month,) -> spent
+    budget_years = defaultdict(lambda: [0] * len(BUDGET_YEAR_COLUMNS))
+
+    for fp, sign in ((before, -1), (after, 1)):
+        if fp is None:
+            continue
+        for year, *values in fp.budget:
+            for i, value in enumerate(values):
+                budget_years[year][i] += sign * value
+        if fp.approved:
+            summary[fp.key][0] += sign
+            summary[fp.key][1] += sign * fp.amount
+            if fp.end_date is not None:
+                endings[fp.end_date][0] += sign
+                endings[fp.end_date][1] += sign * fp.amount
+
+    # Spend follows the award whatever its status, so it only moves with the key
+    old_key = before.key if before else None
+    new_key = after.key if after else None
+    if old_key != new_key:
+        cur.execute(
+            """
+            SELECT date_trunc('month', date_submitted)::date, SUM(amount)
+            FROM transactions
+            WHERE award_id = %s AND status = 'Approved'
+            GROUP BY 1
+            """,
+            (award_id,),
+        )
+        for month, spent in cur.fetchall():
+            for key, sign in ((old_key, -1), (new_key, 1)):
+                if key is None or not spent:
+                    continue
+                summary[key][2] += sign * spent
+                if month is not None:
+                    monthly[key + (month,)] += sign * spent
+
+    _upsert(cur, "portfolio_summary", KEY_COLUMNS,
+            ("approved_awards", "committed_amount", "spent_amount"),
+            [(*key, *v) for key, v in summary.items() if any(v)], touch=True)
+    _upsert(cur, "portfolio_monthly_spend", KEY_COLUMNS + ("month",), ("spent_amount",),
+            [(*key, v) for key, v in monthly.items() if v])
+    _upsert(cur, "portfolio_endings", ("end_date",), ("approved_awards", "committed_amount"),
+            [(end_date, *v) for end_date, v in endings.items() if any(v)])
+    _upsert(cur, "portfolio_budget_years", ("year",), BUDGET_YEAR_COLUMNS,
+            [(year, *v) for year, v in budget_years.items() if any(v)])
+
+
+def apply_spend_deltas(cur):
+    """
+    Fold spend_deltas (see budget_lines) into portfolio_summary and, for
+    rows with a spent_on date, portfolio_monthly_spend.
+    """
+    # Deltas are keyed by the award's current college/department/...; an
+    # edit moving the award's spend elsewhere waits for us (and we for it)
+    cur.execute(
+        """
+        SELECT 1 FROM awards
+        WHERE award_id IN (SELECT award_id FROM spend_deltas)
+        ORDER BY award_id
+        FOR KEY SHARE
+        """
+    )
+    cur.execute(
+        f"""
+        WITH d AS (
+            SELECT {_key_sql()},
+                   date_trunc('month', s.spent_on)::date AS month,
+                   SUM(s.delta) AS delta
+            FROM spend_deltas s
+            JOIN awards a ON a.award_id = s.award_id
+            GROUP BY 1, 2, 3, 4, 5
+        ), monthly AS (
+            INSERT INTO portfolio_monthly_spend ({_KEYS}, month, spent_amount)
+            SELECT {_KEYS}, month, delta FROM d
+            WHERE month IS NOT NULL AND delta <> 0
+            ORDER BY {_KEYS}, month
+            ON CONFLICT ({_KEYS}, month) DO UPDATE
+            SET spent_amount = portfolio_monthly_spend.spent_amount + EXCLUDED.spent_amount
+        )
+        INSERT INTO portfolio_summary ({_KEYS}, spent_amount)
+        SELECT {_KEYS}, SUM(delta) FROM d
+        GROUP BY {_KEYS}
+        HAVING SUM(delta) <> 0
+        ORDER BY {_KEYS}
+        ON CONFLICT ({_KEYS}) DO UPDATE
+        SET spent_amount = portfolio_summary.spent_amount + EXCLUDED.spent_amount,
+            updated_at = CURRENT_TIMESTAMP
+        """
+    )
+
+
+def rebuild(cur):
+    """
+    Rebuild the summary tables from awards and transactions inside the
+    caller's transaction. Returns {table: {"rows", "drifted"}}, drifted
+    counting the keys whose maintained values were off.
+    """
+    report = {}
+    # Writers touch these last, right before they commit (see
+    # budget_lines.reconcile)
+    cur.execute(
+        f"LOCK TABLE {', '.join(t[0] for t in _TABLES)} IN SHARE ROW EXCLUSIVE MODE"
+    )
+    for table, keys, values, select in _TABLES:
+        cur.execute(f"CREATE TEMP TABLE portfolio_fresh ON COMMIT DROP AS {select}")
+        cur.execute(
+            f"""
+            SELECT COUNT(*)
+            FROM {table} t
+            FULL OUTER JOIN portfolio_fresh f USING ({", ".join(keys)})
+            WHERE ({", ".join(f"COALESCE(t.{c}, 0)" for c in values)})
+               <> ({", ".join(f"COALESCE(f.{c}, 0)" for c in values)})
+            """
+        )
+        drifted = cur.fetchone()[0]
+        columns = ", ".join(keys + values)
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM portfolio_fresh")
+        report[table] = {"rows": cur.rowcount, "drifted": drifted}
+        cur.execute("DROP TABLE portfolio_fresh")
+    return report
+
+
+def refresh(conn):
+    """
+    ``rebuild`` in a transaction of its own. Commits (or rolls back)
+    ``conn`` and returns the rebuild report.
+    """
+    cur = conn.cursor()
+    try:
+        report = rebuild(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return report
+
+
+def budget_years(conn):
+    """
+    The itemized budget of every submitted award, per year, as one
+    budget_calc.AwardBudget.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT year, {", ".join(BUDGET_YEAR_COLUMNS)}
+        FROM portfolio_budget_years
+        WHERE ({", ".join(BUDGET_YEAR_COLUMNS)}) <> ({", ".join("0" for _ in BUDGET_YEAR_COLUMNS)})
+        ORDER BY year = -1, year
+        """
+    )
+    rows = cur.fetchall()
+    cur.close()
+    matrix = np.asarray([r[1:] for r in rows], dtype=np.float64)
+    matrix = matrix.reshape(len(rows), len(BUDGET_YEAR_COLUMNS))
+    n_cat = len(BUDGET_CATEGORIES)
+    return AwardBudget([r[0] for r in rows], matrix[:, :n_cat], matrix[:, n_cat])
+
+
+def _month_start(d, back=0):
+    """First day of the month ``back`` months before d's."""
+    n = d.year * 12 + d.month - 1 - back
+    return date(n // 12, n % 12 + 1, 1)
+
+
+def _money(value):
+    return round(float(value or 0), 2)
+
+
+def analytics(cur, ending_within=ENDING_SOON_DAYS, today=None):
+    """
+    The portfolio as a JSON-ready dict: totals plus breakdowns by college,
+    department, sponsor_type and fiscal_year (committed, spent, remaining,
+    monthly burn rate and months of runway at that rate), the monthly
+    spend behind the burn rate, and the Approved awards ending within
+    ``ending_within`` days.
+    """
+    today = today or date.today()
+    until = _month_start(today)
+    since = _month_start(today, BURN_RATE_MONTHS)
+    cur = cur.connection.cursor()
+
+    # One pass over the summary; GROUPING() tells the sets apart
+    cur.execute(
+        f"""
+        WITH recent AS (
+            SELECT {_KEYS}, SUM(spent_amount) AS spent
+            FROM portfolio_monthly_spend
+            WHERE month >= %(since)s AND month < %(until)s
+            GROUP BY {_KEYS}
+        )
+        SELECT GROUPING(s.college, s.department, s.sponsor_type, s.fiscal_year),
+               s.college, s.department, s.sponsor_type, s.fiscal_year,
+               COALESCE(SUM(s.approved_awards), 0), COALESCE(SUM(s.committed_amount), 0),
+               COALESCE(SUM(s.spent_amount), 0), COALESCE(SUM(r.spent), 0)
+        FROM portfolio_summary s
+        LEFT JOIN recent r USING ({_KEYS})
+        GROUP BY GROUPING SETS ((), (s.college), (s.college, s.department),
+                                (s.sponsor_type), (s.fiscal_year))
+        """,
+        {"since": since, "until": until},
+    )
+    # GROUPING() bit set = column not grouped on, college first
+    breakdowns = {0b0111: "by_college", 0b0011: "by_department",
+                  0b1101: "by_sponsor_type", 0b1110: "by_fiscal_year"}
+    result = {name: [] for name in breakdowns.values()}
+    for grouping, college, department, sponsor_type, fiscal_year, awards, committed, spent, recent in cur.fetchall():
+        burn = _money(recent / BURN_RATE_MONTHS)
+        entry = {
+            "approved_awards": int(awards),
+            "committed": _money(committed),
+            "spent": _money(spent),
+            "remaining": _money(committed - spent),
+            "burn_rate": burn,
+            "runway_months": max(0.0, round(float(committed - spent) / burn, 1)) if burn > 0 else None,
+        }
+        if grouping == 0b1111:
+            totals = entry
+            continue
+        if not (awards or committed or spent):
+            continue
+        labels = {"college": college, "department": department,
+                  "sponsor_type": sponsor_type, "fiscal_year": fiscal_year}
+        name = breakdowns[grouping]
+        shown = [c for c, bit in zip(KEY_COLUMNS, (8, 4, 2, 1)) if not grouping & bit]
+        result[name].append({**{c: labels[c] or None for c in shown}, **entry})
+    for entries in result.values():
+        entries.sort(key=lambda e: -e["committed"])
+
+    cur.execute(
+        """
+        SELECT month, SUM(spent_amount)
+        FROM portfolio_monthly_spend
+        WHERE month >= %s AND month < %s
+        GROUP BY month
+        ORDER BY month
+        """,
+        (since, until),
+    )
+    monthly = [{"month": month.isoformat(), "spent": _money(spent)} for month, spent in cur.fetchall()]
+
+    horizon = today + timedelta(days=ending_within)
+    cur.execute(
+        """
+        SELECT COALESCE(SUM(approved_awards), 0), COALESCE(SUM(committed_amount), 0)
+        FROM portfolio_endings
+        WHERE end_date BETWEEN %s AND %s
+        """,
+        (today, horizon),
+    )
+    ending_count, ending_committed = cur.fetchone()
+    cur.execute(
+        """
+        SELECT award_id, title, college, department, sponsor_type, end_date, amount
+        FROM awards
+        WHERE status = 'Approved' AND end_date BETWEEN %s AND %s
+        ORDER BY end_date, award_id
+        LIMIT %s
+        """,
+        (today, horizon, ENDING_SOON_LIMIT),
+    )
+    soonest = [
+        {"award_id": award_id, "title": title, "college": college, "department": department,
+         "sponsor_type": sponsor_type, "end_date": end_date.isoformat(), "amount": _money(amount)}
+        for award_id, title, college, department, sponsor_type, end_date, amount in cur.fetchall()
+    ]
+    cur.close()
+
+    return {
+        "as_of": today.isoformat(),
+        "totals": totals,
+        **result,
+        "burn_rate": {"months": BURN_RATE_MONTHS, "monthly_spend": monthly},
+        "ending_soon": {
+            "days": ending_within,
+            "approved_awards": int(ending_count),
+            "committed": _money(ending_committed),
+            "awards": soonest,
+        },
+    }
@@ -0,0 +1,334 @@
+"""Split-purchase detection over transactions.
+
+    python split_purchases.py [--full]
+
+A split purchase is several orders on one award, in one category, by one
+user, inside a SPLIT_PURCHASE_WINDOW_DAYS window, that are each under the
+procurement (competitive bidding) threshold but together reach it -- "Two
+6k orders to avoid 10k rules". Thresholds come from the compiled policies
+(policy_rules.RuleSet.bidding_thresholds) per budget category, falling back
+to SPLIT_PURCHASE_THRESHOLD.
+
+Transactions are read once in (award_id, date_submitted) order and every
+(award, category, user) group keeps a sliding window (two pointers: push the
+new order, drop orders older than the window from the front), so a scan is
+linear in the number of transactions. Overlapping windows that cross the
+threshold are merged into one flagged cluster in ``split_purchase_flags``.
+
+Modes:
+    incremental  rescan only the awards listed in split_purchase_pending
+                 (ingest.py adds every award an import touched)
+    full         rescan every award and rebuild all flags
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from datetime import date, timedelta
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+from policy_rules import category_for, get_rules
+
+SPLIT_PURCHASE_WINDOW_DAYS = int(os.getenv("SPLIT_PURCHASE_WINDOW_DAYS", "30"))
+# Used for categories the policies give no bidding threshold for
+SPLIT_PURCHASE_THRESHOLD = Decimal(os.getenv("SPLIT_PURCHASE_THRESHOLD", "10000"))
+# Policy categories that are not procurement (never split purchases)
+NON_PROCUREMENT_CATEGORIES = ("Personnel", "Travel", "Participant Support")
+
+# Rows per round trip from the server-side cursor
+SCAN_FETCH_SIZE = 20000
+FLAG_INSERT_BATCH = 1000
+JOB_TYPE = "detect_split_purchases"
+# Serializes scans so a full rebuild and an incremental run don't interleave
+_SCAN_LOCK_KEY = 0x53504C54    # "SPLT"
+# Scans read dates as day numbers from this epoch and amounts as integer
+# cents; both convert far faster than date / Decimal objects
+_EPOCH = date(2000, 1, 1)
+
+
+class _Group:
+    """Sliding window of one (award, category, user) plus its open cluster."""
+
+    __slots__ = ("threshold", "window", "total", "seq", "cluster")
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.window = deque()   # (seq, transaction_id, cents, day number)
+        self.total = 0
+        self.seq = 0
+        self.cluster = None
+
+    def push(self, transaction_id, amount, day, span):
+        """Add an order; returns a cluster that just closed, if any."""
+        self.seq += 1
+        window = self.window
+        window.append((self.seq, transaction_id, amount, day))
+        self.total += amount
+        while window[0][3] < day - span:
+            self.total -= window.popleft()[2]
+
+        closed = None
+        cluster = self.cluster
+        if cluster is not None and window[0][0] > cluster["last_seq"]:
+            # Every member has left the window
+            closed, cluster = self.close(), None
+
+        if len(window) > 1 and self.total >= self.threshold:
+            if cluster is None:
+                cluster = self.cluster = {
+                    "first_date": window[0][3], "last_seq": 0, "ids": [], "total": 0,
+                }
+            # Members are a prefix of the pushed orders, so the new ones are
+            # the window's tail after last_seq
+            new = []
+            for seq, txn_id, amt, _day in reversed(window):
+                if seq <= cluster["last_seq"]:
+                    break
+                new.append((txn_id, amt))
+            for txn_id, amt in reversed(new):
+                cluster["ids"].append(txn_id)
+                cluster["total"] += amt
+            cluster["last_seq"] = self.seq
+            cluster["last_date"] = day
+        return closed
+
+    def close(self):
+        cluster, self.cluster = self.cluster, None
+        return cluster
+
+
+def detect_clusters(rows, threshold_for, window_days=SPLIT_PURCHASE_WINDOW_DAYS):
+    """
+    Yield split-purchase clusters from rows of (award_id, transaction_id,
+    user_id, category, amount in cents, day number) sorted by award_id,
+    then day. ``threshold_for(category)`` returns the procurement threshold
+    in cents, or None for categories that are not checked.
+    """
+    span = window_days
+    award = None
+    groups = {}
+    for award_id, txn_id, user_id, category, amount, day in rows:
+        if award_id != award:
+            yield from _flush(groups)
+            groups = {}
+            award = award_id
+        threshold = threshold_for(category)
+        if threshold is None or amount >= threshold:
+            # Large single orders are the bidding rule's business, not ours
+            continue
+        key = (award_id, category, user_id)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _Group(threshold)
+        closed = group.push(txn_id, amount, day, span)
+        if closed is not None:
+            yield _as_flag(key, group.threshold, closed)
+    yield from _flush(groups)
+
+
+def _flush(groups):
+    for key, group in groups.items():
+        if group.cluster is not None:
+            yield _as_flag(key, group.threshold, group.close())
+
+
+def _as_flag(key, threshold, cluster):
+    award_id, category, user_id = key
+    return {
+        "award_id": award_id,
+        "category": category,
+        "user_id": user_id,
+        "first_date": _EPOCH + timedelta(days=cluster["first_date"]),
+        "last_date": _EPOCH + timedelta(days=cluster["last_date"]),
+        "order_count": len(cluster["ids"]),
+        "total_amount": Decimal(cluster["total"]).scaleb(-2),
+        "threshold": Decimal(threshold).scaleb(-2),
+        "transaction_ids": cluster["ids"],
+    }
+
+
+def threshold_lookup(rules):
+    """category -> threshold in cents (or None) for the transactions' categories."""
+    cache = {}
+
+    def threshold_for(category):
+        try:
+            return cache[category]
+        except KeyError:
+            pass
+        policy_category = category_for(category) or "Other Direct Costs"
+        if policy_category in NON_PROCUREMENT_CATEGORIES:
+            threshold = None
+        else:
+            bidding = rules.bidding_thresholds.get(policy_category)
+            threshold = int(round(Decimal(str(bidding[0])) * 100)) if bidding \
+                else int(SPLIT_PURCHASE_THRESHOLD * 100)
+        cache[category] = threshold
+        return threshold
+
+    return threshold_for
+
+
+def scan(conn, full=False, progress=None):
+    """
+    Rebuild split_purchase_flags for the pending awards (or all awards with
+    ``full``) and commit. Returns a stats dict.
+    """
+    started = time.monotonic()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_SCAN_LOCK_KEY,))
+        threshold_for = threshold_lookup(get_rules(cur))
+
+        if full:
+            cur.execute("DELETE FROM split_purchase_pending")
+            cur.execute("DELETE FROM split_purchase_flags")
+            award_ids = None
+        else:
+            cur.execute("DELETE FROM split_purchase_pending RETURNING award_id")
+            award_ids = sorted(r[0] for r in cur.fetchall())
+            if not award_ids:
+                conn.commit()
+                return {"mode": "incremental", "awards": 0, "transactions": 0,
+                        "flags": 0, "flagged_transactions": 0, "seconds": 0.0}
+            cur.execute("DELETE FROM split_purchase_flags WHERE award_id = ANY(%s)", (award_ids,))
+
+        # Served in order by transactions_award_date_idx
+        rows = conn.cursor(name="split_purchase_scan")
+        rows.itersize = SCAN_FETCH_SIZE
+        rows.execute(
+            f"""
+            SELECT award_id, transaction_id, user_id, category,
+                   (amount * 100)::bigint, date_submitted - %(epoch)s
+            FROM transactions
+            WHERE status <> 'Declined' AND amount > 0 AND date_submitted IS NOT NULL
+              {'' if full else 'AND award_id = ANY(%(award_ids)s)'}
+            ORDER BY award_id, date_submitted, transaction_id
+            """,
+            {"award_ids": award_ids, "epoch": _EPOCH},
+        )
+
+        counted = _Counter(rows, progress)
+        flags = flagged = 0
+        batch = []
+        for flag in detect_clusters(counted, threshold_for):
+            batch.append(flag)
+            flags += 1
+            flagged += flag["order_count"]
+            if len(batch) >= FLAG_INSERT_BATCH:
+                _insert_flags(cur, batch)
+                batch = []
+        _insert_flags(cur, batch)
+        rows.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return {
+        "mode": "full" if full else "incremental",
+        "awards": counted.awards,
+        "transactions": counted.rows,
+        "flags": flags,
+        "flagged_transactions": flagged,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+class _Counter:
+    """Pass-through over scan rows that counts them and reports progress."""
+
+    def __init__(self, rows, progress=None):
+        self._rows = rows
+        self._progress = progress
+        self.rows = 0
+        self.awards = 0
+
+    def __iter__(self):
+        last_award = None
+        for row in self._rows:
+            self.rows += 1
+            if row[0] != last_award:
+                last_award = row[0]
+                self.awards += 1
+            if self._progress and self.rows % SCAN_FETCH_SIZE == 0:
+                self._progress(self.rows)
+            yield row
+
+
+def _insert_flags(cur, flags):
+    if not flags:
+        return
+    execute_values(
+        cur,
+        """
+        INSERT INTO split_purchase_flags
+            (award_id, category, user_id, first_date, last_date,
+             order_count, total_amount, threshold, transaction_ids)
+        VALUES %s
+        """,
+        [
+            (f["award_id"], f["category"], f["user_id"], f["first_date"], f["last_date"],
+             f["order_count"], f["total_amount"], f["threshold"], f["transaction_ids"])
+            for f in flags
+        ],
+    )
+
+
+def queue_scan(cur, created_by_email=None):
+    """
+    Queue an incremental scan unless one is already waiting (it will pick up
+    whatever is in split_purchase_pending when it runs). Returns the job_id.
+    """
+    from jobs import enqueue
+
+    cur.execute(
+        """
+        SELECT job_id FROM jobs
+        WHERE job_type = %s AND status = 'queued' AND payload = '{}'::jsonb
+        ORDER BY job_id LIMIT 1
+        """,
+        (JOB_TYPE,),
+    )
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    return enqueue(cur, JOB_TYPE, created_by_email=created_by_email)
+
+
+def award_flags(cur, award_id):
+    """Flagged clusters of one award, newest first."""
+    cur.execute(
+        """
+        SELECT f.category, f.first_date, f.last_date, f.order_count,
+               f.total_amount, f.threshold, f.transaction_ids, u.email AS user_email
+        FROM split_purchase_flags f
+        LEFT JOIN users u ON u.user_id = f.user_id
+        WHERE f.award_id = %s
+        ORDER BY f.last_date DESC
+        """,
+        (award_id,),
+    )
+    return cur.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect split purchases in transactions")
+    parser.add_argument("--full", action="store_true",
+                        help="rescan every award instead of the pending ones")
+    args = parser.parse_args(argv)
+
+    from db import db_connection
+
+    with db_connection() as conn:
+        stats = scan(conn, full=args.full)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,21 @@ document.addEventListener('DOMContentLoaded', function () {
     document.getElementById('end_date') ||
     document.querySelector('input[name="end_date"]');
 
+  // ---------- LINE ITEM IDS ----------
+  // Each row keeps a stable id (data-item-id) so the server can diff edits
+  // line by line instead of rewriting every row.
+  function newItemId() {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+      return window.crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+
+  function itemIdFor(el) {
+    if (!el.dataset.itemId) el.dataset.itemId = newItemId();
+    return el.dataset.itemId;
+  }
+
   // ---------- DATE → YEARS HELPER ----------
   function getYearsInRange() {
     if (!startInput || !endInput) return [];
@@ -153,6 +168,7 @@ document.addEventListener('DOMContentLoaded', function () {
     });
     const container = row.querySelector('.year-hours');
     if (container) container.innerHTML = '';
+    delete row.dataset.itemId;
   }
 
   if (addPersonBtn && personTemplate) {
@@ -212,6 +228,7 @@ document.addEventListener('DOMContentLoaded', function () {
         el.value = '';
       }
     });
+    delete block.dataset.itemId;
   }
 
   if (domesticList && addDomesticBtn && domesticTemplate) {
@@ -267,6 +284,7 @@ document.addEventListener('DOMContentLoaded', function () {
         el.value = '';
       }
     });
+    delete block.dataset.itemId;
   }
 
   if (materialsList && addMaterialBtn && materialTemplate) {
@@ -321,6 +339,7 @@ document.addEventListener('DOMContentLoaded', function () {
         }
 
         personnel.push({
+          id: itemIdFor(row),
           name: nameInput.value.trim(),
           position: posSelect ? posSelect.value.trim() : '',
           same_each_year: sameChk ? !!sameChk.checked : false,
@@ -348,6 +367,7 @@ document.addEventListener('DOMContentLoaded', function () {
         if (allEmpty) return;
 
         domesticTrips.push({
+          id: itemIdFor(item),
           name,
           description: desc,
           year,
@@ -380,6 +400,7 @@ document.addEventListener('DOMContentLoaded', function () {
         if (allEmpty) return;
 
         intlTrips.push({
+          id: itemIdFor(item),
           name,
           description: desc,
           year,
@@ -406,6 +427,7 @@ document.addEventListener('DOMContentLoaded', function () {
         if (!category && !cost && !desc && !year) return;
 
         materials.push({
+          id: itemIdFor(item),
           category,
           cost: cost ? parseFloat(cost) : null,
           description: desc,
@@ -443,6 +465,7 @@ document.addEventListener('DOMContentLoaded', function () {
         const posSelect = row.querySelector('select[name="personnel_position[]"]');
         const sameChk   = row.querySelector('input[name="personnel_same_each_year[]"]');
 
+        if (p.id) row.dataset.itemId = p.id;
         if (nameInput) nameInput.value = p.name || '';
         if (posSelect) posSelect.value = p.position || '';
         if (sameChk)   sameChk.checked = !!p.same_each_year;
@@ -513,6 +536,7 @@ document.addEventListener('DOMContentLoaded', function () {
         const foodVal   = t.food_lodge_per_day || t.food_per_day || '';
         const daysVal   = t.num_days || t.days || '';
 
+        if (t.id) block.dataset.itemId = t.id;
         if (nameInput)   nameInput.value   = t.travel_name || t.name || '';
         if (descArea)    descArea.value    = t.description || '';
         if (departInput) departInput.value = departVal;
@@ -575,6 +599,7 @@ document.addEventListener('DOMContentLoaded', function () {
         const foodVal   = t.food_lodge_per_day || t.food_per_day || '';
         const daysVal   = t.num_days || t.days || '';
 
+        if (t.id) block.dataset.itemId = t.id;
         if (nameInput)   nameInput.value   = t.travel_name || t.name || '';
         if (descArea)    descArea.value    = t.description || '';
         if (departInput) departInput.value = departVal;
@@ -625,6 +650,7 @@ document.addEventListener('DOMContentLoaded', function () {
         const costVal = m.cost != null ? m.cost : '';
         const yearVal = m.year != null ? String(m.year) : '';
 
+        if (m.id) block.dataset.itemId = m.id;
         if (catSelect) catSelect.value = catVal;
         if (costInput && costVal !== '') costInput.value = costVal;
         if (descArea)  descArea.value  = m.description || '';
@@ -0,0 +1,43 @@
+"""Background job worker.
+
+    python worker.py [--concurrency 4] [--types bulk_export ...]
+
+Runs next to the web service against the same database; handlers are the
+ones app.py registers with @job_handler.
+"""
+import argparse
+import os
+
+# Pooled connections one job holds at most at once: the handler's own, one
+# it borrows meanwhile (ai_review's per-batch cache writes) and a progress
+# update
+JOB_CONNECTIONS = 3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GrantGuard background job worker")
+    parser.add_argument(
+        "--concurrency", type=int,
+        default=int(os.getenv("JOB_CONCURRENCY", "2")),
+        help="jobs processed in parallel by this process",
+    )
+    parser.add_argument(
+        "--types", nargs="*", default=None,
+        help="only claim these job types (default: all)",
+    )
+    args = parser.parse_args(argv)
+
+    # Size the pool before db.py reads the setting: per job thread,
+    # JOB_CONNECTIONS at once, plus one for the stale-job sweep. The
+    # heartbeat has a connection of its own, outside the pool.
+    os.environ.setdefault("DB_POOL_MAX", str(args.concurrency * JOB_CONNECTIONS + 1))
+
+    import app  # noqa: F401  (registers the job handlers)
+    from jobs import run_worker
+
+    print(f"Job worker started (concurrency={args.concurrency}, types={args.types or 'all'})")
+    run_worker(args.concurrency, args.types)
+
+
+if __name__ == "__main__":
+    main()